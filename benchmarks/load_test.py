@@ -0,0 +1,171 @@
+# -*- coding: UTF-8 -*-
+"""
+Load test for the DataDomainView end points.
+
+Drives the real Flask app in-process, with the Celery broker swapped for an
+in-memory transport, so the numbers reflect the cost of the API itself (auth,
+schema validation, JSON and publishing the task) and not RabbitMQ or vCenter.
+
+It then runs tasks on an in-process worker, using the same result backend as
+the API, and polls ``/task/<id>`` from a different client thread than the one
+that created the task (like uWSGI does when it runs more than one thread). Any
+task whose status never leaves PENDING fails the run.
+
+Usage::
+
+    python benchmarks/load_test.py --requests 2000
+"""
+import time
+import logging
+import argparse
+import threading
+
+from celery import Celery
+from celery.contrib.testing.worker import start_worker
+from vlab_api_common.http_auth import generate_v2_test_token
+
+from vlab_datadomain_api.app import app
+from vlab_datadomain_api.lib import const
+
+ROUTE = '/api/2/inf/data-domain'
+ENDPOINTS = {
+    'GET {}'.format(ROUTE) : ('get', ROUTE, None),
+    'POST {}'.format(ROUTE) : ('post', ROUTE, {'name': 'myDataDomain', 'image': '7.4.0.5', 'network': 'frontend'}),
+    'DELETE {}'.format(ROUTE) : ('delete', ROUTE, {'name': 'myDataDomain'}),
+    'GET {}/image'.format(ROUTE) : ('get', '{}/image'.format(ROUTE), None),
+}
+
+
+def percentile(samples, pct):
+    """Obtain the value at a given percentile from a sorted list of samples
+
+    :Returns: Float
+
+    :param samples: The sorted latencies, in seconds
+    :type samples: List
+
+    :param pct: The percentile to look up, i.e. 99
+    :type pct: Integer
+    """
+    index = min(len(samples) - 1, int(round(pct / 100.0 * len(samples))) - 1)
+    return samples[max(index, 0)]
+
+
+def worker(method, url, body, headers, count, latencies):
+    """Send ``count`` requests, recording how long each one took"""
+    client = app.test_client()
+    call = getattr(client, method)
+    for _ in range(count):
+        start = time.perf_counter()
+        resp = call(url, headers=headers, json=body)
+        latencies.append(time.perf_counter() - start)
+        if resp.status_code != 202:
+            raise RuntimeError('{} {} returned HTTP {}'.format(method.upper(), url, resp.status_code))
+
+
+def run(name, threads, requests, headers):
+    """Load test one end point, and print the results"""
+    method, url, body = ENDPOINTS[name]
+    latencies = []
+    per_thread = max(1, requests // threads)
+    pool = [threading.Thread(target=worker, args=(method, url, body, headers, per_thread, latencies))
+            for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print('{:<35} {:>9.1f} req/s   p50 {:>7.2f}ms   p90 {:>7.2f}ms   p99 {:>7.2f}ms'.format(
+          name,
+          len(latencies) / elapsed,
+          percentile(latencies, 50) * 1000,
+          percentile(latencies, 90) * 1000,
+          percentile(latencies, 99) * 1000))
+
+
+def create_then_poll(index, headers, count, created, barrier, timeout, latencies, stuck):
+    """Create ``count`` tasks, then poll the tasks the next client thread created
+    until they complete, or ``timeout`` seconds pass"""
+    client = app.test_client()
+    for _ in range(count):
+        resp = client.get(ROUTE, headers=headers)
+        created[index].append(resp.json['content']['task-id'])
+    barrier.wait()
+    pending = list(created[(index + 1) % len(created)])
+    start = time.perf_counter()
+    while pending and time.perf_counter() - start < timeout:
+        still_pending = []
+        for task_id in pending:
+            resp = client.get('{}/task/{}'.format(ROUTE, task_id), headers=headers)
+            if resp.status_code == 202:
+                still_pending.append(task_id)
+            else:
+                latencies.append(time.perf_counter() - start)
+        pending = still_pending
+    stuck.extend(pending)
+
+
+def run_task_status(threads, requests, headers, timeout):
+    """Create tasks, then poll /task/<id> for each from another client thread"""
+    celery_app = Celery('datadomain', backend=app.celery_app.conf.result_backend, broker='memory://')
+    # Skip the tasks left over from the other end points, which nothing consumed
+    celery_app.conf.task_default_queue = 'load-test-task-status'
+
+    @celery_app.task(name='datadomain.show')
+    def show(username, txn_id, profile=False):
+        return {'content': {}, 'error': None, 'params': {}}
+
+    original, app.celery_app = app.celery_app, celery_app
+    per_thread = max(1, requests // threads)
+    created = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads)
+    latencies = []
+    stuck = []
+    try:
+        with start_worker(celery_app, perform_ping_check=False):
+            pool = [threading.Thread(target=create_then_poll,
+                                     args=(x, headers, per_thread, created, barrier, timeout, latencies, stuck))
+                    for x in range(threads)]
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+    finally:
+        app.celery_app = original
+    latencies.sort()
+    print('{:<35} {:>9} done     p50 {:>7.2f}ms   p99 {:>7.2f}ms   stuck {}'.format(
+          'GET {}/task/<id>'.format(ROUTE),
+          len(latencies),
+          percentile(latencies, 50) * 1000 if latencies else 0,
+          percentile(latencies, 99) * 1000 if latencies else 0,
+          len(stuck)))
+    if stuck:
+        raise RuntimeError('{} tasks never left PENDING; the result backend does not deliver results across API threads'.format(len(stuck)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--threads', type=int, default=const.VLAB_DATADOMAIN_API_THREADS,
+                        help='Concurrent clients per end point; defaults to the API thread count')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests sent per end point')
+    parser.add_argument('--poll-timeout', type=int, default=10, help='Seconds to wait on created tasks to complete')
+    parser.add_argument('--access-log', action='store_true', help='Keep writing the per-request access log')
+    args = parser.parse_args()
+
+    if not args.access_log:
+        logging.getLogger('vlab_api_common.flask_common').setLevel(logging.WARNING)
+
+    app.health_prober.stop()
+    original = app.celery_app
+    app.celery_app = Celery('datadomain', backend='cache+memory://', broker='memory://')
+    headers = {'X-Auth': generate_v2_test_token(username='bob')}
+    for name in ENDPOINTS:
+        run(name, args.threads, args.requests, headers)
+    app.celery_app = original
+    run_task_status(args.threads, min(args.requests, 200), headers, args.poll_timeout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*-
+"""
+Cold start and healthcheck benchmark for the datadomain API.
+
+Imports the API in a fresh interpreter several times to measure cold start,
+reports whether the vSphere stack (pyVmomi) was pulled into the API process,
+then times the healthcheck end point.
+
+Usage::
+
+    python benchmarks/startup.py --imports 5 --healthchecks 5000
+"""
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import vlab_datadomain_api.app
+print(time.perf_counter() - start, 'pyVmomi' in sys.modules)
+"""
+
+
+def cold_start(runs):
+    """Import the API app in ``runs`` new interpreters
+
+    :Returns: Tuple (List of seconds, Boolean pyVmomi loaded)
+    """
+    timings = []
+    vsphere_loaded = False
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_PROBE],
+                                         stderr=subprocess.DEVNULL)
+        seconds, loaded = output.decode().split()
+        timings.append(float(seconds))
+        vsphere_loaded = vsphere_loaded or loaded == 'True'
+    return timings, vsphere_loaded
+
+
+def healthcheck(count):
+    """Hit the healthcheck ``count`` times
+
+    :Returns: List of seconds
+    """
+    from vlab_datadomain_api.app import app
+    app.health_prober.stop()
+    client = app.test_client()
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        client.get('/api/1/inf/data-domain/healthcheck')
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--imports', type=int, default=5, help='Number of cold starts to measure')
+    parser.add_argument('--healthchecks', type=int, default=5000, help='Number of healthchecks to send')
+    args = parser.parse_args()
+
+    timings, vsphere_loaded = cold_start(args.imports)
+    print('cold start (import app)    median {:>8.1f}ms   max {:>8.1f}ms'.format(
+          statistics.median(timings) * 1000, max(timings) * 1000))
+    print('pyVmomi loaded by the API  {}'.format(vsphere_loaded))
+    timings = healthcheck(args.healthchecks)
+    print('healthcheck                median {:>8.1f}us   max {:>8.1f}us'.format(
+          statistics.median(timings) * 1000000, max(timings) * 1000000))
+
+
+if __name__ == '__main__':
+    main()
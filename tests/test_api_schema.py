@@ -42,6 +42,16 @@ class TestDataDomainViewSchema(unittest.TestCase):
 
         self.assertTrue(schema_valid)
 
+    def test_reset_schema(self):
+        """The schema defined for POST on /reset is valid"""
+        try:
+            Draft4Validator.check_schema(datadomain.DataDomainView.RESET_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
     def test_iamges_schema(self):
         """The schema defined for GET on /images is valid"""
         try:
@@ -52,6 +62,26 @@ class TestDataDomainViewSchema(unittest.TestCase):
 
         self.assertTrue(schema_valid)
 
+    def test_inventory_schema(self):
+        """The schema defined for GET on /inventory is valid"""
+        try:
+            Draft4Validator.check_schema(datadomain.DataDomainView.INVENTORY_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
+    def test_power_schema(self):
+        """The schema defined for POST on /power is valid"""
+        try:
+            Draft4Validator.check_schema(datadomain.DataDomainView.POWER_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
 
 if __name__ == '__main__':
     unittest.main()
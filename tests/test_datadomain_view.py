@@ -11,8 +11,11 @@ from vlab_api_common import flask_common
 from vlab_api_common.http_auth import generate_v2_test_token
 
 
+from vlab_datadomain_api.lib import ownership
 from vlab_datadomain_api.lib.views import datadomain
 
+ADMIN_CONST = datadomain.const._replace(VLAB_DATADOMAIN_ADMINS=['admin'])
+
 
 class TestDataDomainView(unittest.TestCase):
     """A set of test cases for the DataDomainView object"""
@@ -30,6 +33,7 @@ class TestDataDomainView(unittest.TestCase):
         cls.app = app.test_client()
         # Mock Celery
         app.celery_app = MagicMock()
+        cls.celery_app = app.celery_app
         cls.fake_task = MagicMock()
         cls.fake_task.id = 'asdf-asdf-asdf'
         app.celery_app.send_task.return_value = cls.fake_task
@@ -90,6 +94,55 @@ class TestDataDomainView(unittest.TestCase):
 
         self.assertEqual(task_id, expected)
 
+    def test_post_snapshot(self):
+        """DataDomainView - POST on /api/2/inf/data-domain can request a baseline snapshot"""
+        self.app.post('/api/2/inf/data-domain',
+                      headers={'X-Auth': self.token},
+                      json={'network': "someLAN",
+                            'name': "myDataDomainBox",
+                            'image': "someVersion",
+                            'snapshot': True})
+
+        the_args, _ = self.celery_app.send_task.call_args
+        snapshot = the_args[1][-1]
+
+        self.assertTrue(snapshot)
+
+    def test_post_bad_image(self):
+        """DataDomainView - POST on /api/2/inf/data-domain returns 400 for an image that does not exist"""
+        self.app.application.health_prober = MagicMock()
+        self.app.application.health_prober.has_image.return_value = False
+        resp = self.app.post('/api/2/inf/data-domain',
+                             headers={'X-Auth': self.token},
+                             json={'network': "someLAN",
+                                   'name': "myDataDomainBox",
+                                   'image': "someVersion"})
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(self.celery_app.send_task.called)
+
+    def test_reset_task(self):
+        """DataDomainView - POST on /api/2/inf/data-domain/reset returns a task-id"""
+        resp = self.app.post('/api/2/inf/data-domain/reset',
+                             headers={'X-Auth': self.token},
+                             json={'name' : 'myDataDomainBox'})
+
+        task_id = resp.json['content']['task-id']
+        expected = 'asdf-asdf-asdf'
+
+        self.assertEqual(task_id, expected)
+
+    def test_reset_task_link(self):
+        """DataDomainView - POST on /api/2/inf/data-domain/reset sets the Link header"""
+        resp = self.app.post('/api/2/inf/data-domain/reset',
+                             headers={'X-Auth': self.token},
+                             json={'name' : 'myDataDomainBox'})
+
+        task_id = resp.headers['Link']
+        expected = '<https://localhost/api/2/inf/data-domain/task/asdf-asdf-asdf>; rel=status'
+
+        self.assertEqual(task_id, expected)
+
     def test_delete_task(self):
         """DataDomainView - DELETE on /api/2/inf/data-domain returns a task-id"""
         resp = self.app.delete('/api/2/inf/data-domain',
@@ -112,6 +165,184 @@ class TestDataDomainView(unittest.TestCase):
 
         self.assertEqual(task_id, expected)
 
+    def test_delete_no_wait(self):
+        """DataDomainView - DELETE on /api/2/inf/data-domain supports not waiting on the destroy"""
+        self.app.delete('/api/2/inf/data-domain',
+                        headers={'X-Auth': self.token},
+                        json={'name' : 'myDataDomainBox', 'wait': False})
+
+        the_args, _ = self.celery_app.send_task.call_args
+        expected = ('datadomain.delete', ['bob', 'myDataDomainBox', 'noId', False])
+
+        self.assertEqual(the_args, expected)
+
+    def test_get_profile(self):
+        """DataDomainView - GET on /api/2/inf/data-domain profiles the task when X-PROFILE is set"""
+        self.app.get('/api/2/inf/data-domain',
+                     headers={'X-Auth': self.token, 'X-PROFILE': 'true', 'X-REQUEST-ID': 'myId'})
+
+        _, the_kwargs = self.celery_app.send_task.call_args
+
+        self.assertEqual(the_kwargs['kwargs'], {'profile': True})
+
+    def test_get_profile_no_request_id(self):
+        """DataDomainView - GET on /api/2/inf/data-domain returns 400 when X-PROFILE is set without X-REQUEST-ID"""
+        resp = self.app.get('/api/2/inf/data-domain',
+                            headers={'X-Auth': self.token, 'X-PROFILE': 'true'})
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(self.celery_app.send_task.called)
+
+    def test_post_profile_no_request_id(self):
+        """DataDomainView - POST on /api/2/inf/data-domain returns 400 when X-PROFILE is set without X-REQUEST-ID"""
+        resp = self.app.post('/api/2/inf/data-domain',
+                             headers={'X-Auth': self.token, 'X-PROFILE': 'true'},
+                             json={'network': 'someLAN', 'name': 'myDataDomainBox', 'image': 'someVersion'})
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_get_no_profile(self):
+        """DataDomainView - GET on /api/2/inf/data-domain does not profile by default"""
+        self.app.get('/api/2/inf/data-domain',
+                     headers={'X-Auth': self.token})
+
+        _, the_kwargs = self.celery_app.send_task.call_args
+
+        self.assertEqual(the_kwargs['kwargs'], {})
+
+    def test_profile_task(self):
+        """DataDomainView - GET on /api/2/inf/data-domain/profile/<txn_id> returns a task-id"""
+        resp = self.app.get('/api/2/inf/data-domain/profile/myId',
+                            headers={'X-Auth': self.token})
+
+        task_id = resp.json['content']['task-id']
+        the_args, _ = self.celery_app.send_task.call_args
+
+        self.assertEqual(task_id, 'asdf-asdf-asdf')
+        self.assertEqual(the_args, ('datadomain.profile', ['bob', 'myId', 'noId']))
+
+    def test_inventory_not_admin(self):
+        """DataDomainView - GET on /api/2/inf/data-domain/inventory returns 403 for non-admins"""
+        resp = self.app.get('/api/2/inf/data-domain/inventory',
+                            headers={'X-Auth': self.token})
+
+        self.assertEqual(resp.status_code, 403)
+
+    def test_inventory_no_default_admins(self):
+        """DataDomainView - GET on /api/2/inf/data-domain/inventory has no admins unless configured"""
+        token = generate_v2_test_token(username='admin')
+        resp = self.app.get('/api/2/inf/data-domain/inventory',
+                            headers={'X-Auth': token})
+
+        self.assertEqual(resp.status_code, 403)
+
+    @patch.object(datadomain, 'const', ADMIN_CONST)
+    def test_inventory(self):
+        """DataDomainView - GET on /api/2/inf/data-domain/inventory sends the filters and page to the task"""
+        token = generate_v2_test_token(username='admin')
+        resp = self.app.get('/api/2/inf/data-domain/inventory?version=7.4.0.5&state=poweredOn&offset=10&limit=20',
+                            headers={'X-Auth': token})
+
+        the_args, _ = self.celery_app.send_task.call_args
+        expected = ('datadomain.inventory', ['7.4.0.5', 'poweredOn', 10, 20, 'noId'])
+
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(the_args, expected)
+
+    @patch.object(datadomain, 'const', ADMIN_CONST)
+    def test_inventory_bad_limit(self):
+        """DataDomainView - GET on /api/2/inf/data-domain/inventory returns 400 for a non-integer limit"""
+        token = generate_v2_test_token(username='admin')
+        resp = self.app.get('/api/2/inf/data-domain/inventory?limit=lots',
+                            headers={'X-Auth': token})
+
+        self.assertEqual(resp.status_code, 400)
+
+    @patch.object(datadomain, 'const', ADMIN_CONST)
+    def test_inventory_bad_state(self):
+        """DataDomainView - GET on /api/2/inf/data-domain/inventory returns 400 for an unknown power state"""
+        token = generate_v2_test_token(username='admin')
+        resp = self.app.get('/api/2/inf/data-domain/inventory?state=sleeping',
+                            headers={'X-Auth': token})
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_power(self):
+        """DataDomainView - POST on /api/2/inf/data-domain/power sends every name to one task"""
+        resp = self.app.post('/api/2/inf/data-domain/power',
+                             headers={'X-Auth': self.token},
+                             json={'names': ['dd1', 'dd2'], 'power': 'off'})
+
+        the_args, _ = self.celery_app.send_task.call_args
+        expected = ('datadomain.power', ['bob', ['dd1', 'dd2'], 'off', 'noId'])
+
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(the_args, expected)
+
+    def test_power_bad_state(self):
+        """DataDomainView - POST on /api/2/inf/data-domain/power returns 400 for an unknown power state"""
+        resp = self.app.post('/api/2/inf/data-domain/power',
+                             headers={'X-Auth': self.token},
+                             json={'names': ['dd1'], 'power': 'sideways'})
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_task_id_owned(self):
+        """DataDomainView - The task-id of a new task is owned by the user who sent it"""
+        self.app.get('/api/2/inf/data-domain',
+                     headers={'X-Auth': self.token})
+
+        _, the_kwargs = self.celery_app.send_task.call_args
+
+        self.assertTrue(ownership.owned_by(the_kwargs['task_id'], 'bob'))
+
+    def test_cancel(self):
+        """DataDomainView - DELETE on ./task/<id> revokes the task, signaling it to clean up"""
+        task_id = ownership.new_task_id('bob')
+        self.app.delete('/api/2/inf/data-domain/task/{}'.format(task_id),
+                        headers={'X-Auth': self.token})
+
+        the_args, the_kwargs = self.celery_app.control.revoke.call_args
+        expected = ((task_id,), {'terminate': True, 'signal': 'SIGUSR1'})
+
+        self.assertEqual((the_args, the_kwargs), expected)
+
+    def test_cancel_no_broadcast(self):
+        """DataDomainView - DELETE on ./task/<id> does not ask the workers who owns the task"""
+        task_id = ownership.new_task_id('bob')
+        self.app.delete('/api/2/inf/data-domain/task/{}'.format(task_id),
+                        headers={'X-Auth': self.token})
+
+        self.assertFalse(self.celery_app.control.inspect.called)
+
+    def test_cancel_link(self):
+        """DataDomainView - DELETE on ./task/<id> sets the Link header"""
+        task_id = ownership.new_task_id('bob')
+        resp = self.app.delete('/api/2/inf/data-domain/task/{}'.format(task_id),
+                               headers={'X-Auth': self.token})
+
+        link = resp.headers['Link']
+        expected = '<https://localhost/api/2/inf/data-domain/task/{}>; rel=status'.format(task_id)
+
+        self.assertEqual(link, expected)
+
+    def test_cancel_not_owner(self):
+        """DataDomainView - DELETE on ./task/<id> returns 403 for another user's task"""
+        task_id = ownership.new_task_id('alice')
+        resp = self.app.delete('/api/2/inf/data-domain/task/{}'.format(task_id),
+                               headers={'X-Auth': self.token})
+
+        self.assertEqual(resp.status_code, 403)
+        self.assertFalse(self.celery_app.control.revoke.called)
+
+    def test_cancel_unowned_task(self):
+        """DataDomainView - DELETE on ./task/<id> returns 403 for a task no user owns"""
+        resp = self.app.delete('/api/2/inf/data-domain/task/asdf-asdf-asdf',
+                               headers={'X-Auth': self.token})
+
+        self.assertEqual(resp.status_code, 403)
+        self.assertFalse(self.celery_app.control.revoke.called)
+
     def test_image(self):
         """DataDomainView - GET on the ./image end point returns the a task-id"""
         resp = self.app.get('/api/2/inf/data-domain/image',
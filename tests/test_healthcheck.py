@@ -2,7 +2,10 @@
 """
 A suite of tests for the healthcheck API end point
 """
+import sys
 import unittest
+import subprocess
+from unittest.mock import MagicMock
 
 from flask import Flask
 
@@ -28,6 +31,29 @@ class TestHealthView(unittest.TestCase):
 
         self.assertEqual(expected, resp.status_code)
 
+    def test_health_check_version(self):
+        """The /api/1/inf/data-domain/healthcheck end point returns the version of the API"""
+        resp = self.app.get('/api/1/inf/data-domain/healthcheck')
+
+        self.assertTrue('version' in resp.json)
+
+    def test_health_check_deep(self):
+        """The healthcheck end point returns the status cached by the app's health_prober"""
+        app = Flask(__name__)
+        healthcheck.HealthView.register(app)
+        app.health_prober = MagicMock()
+        app.health_prober.serialize.return_value = ('{"healthy": false}', 503)
+        resp = app.test_client().get('/api/1/inf/data-domain/healthcheck')
+
+        self.assertEqual(resp.status_code, 503)
+
+    def test_no_vsphere(self):
+        """The API views do not load pyVmomi"""
+        probe = 'import sys; import vlab_datadomain_api.lib.views; print("pyVmomi" in sys.modules)'
+        output = subprocess.check_output([sys.executable, '-c', probe], stderr=subprocess.DEVNULL)
+
+        self.assertEqual(output.strip(), b'False')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in inventory.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+import ujson
+
+from vlab_datadomain_api.lib.worker import inventory
+
+
+def make_prop(name, val):
+    prop = MagicMock()
+    prop.name = name
+    prop.val = val
+    return prop
+
+
+def make_content(obj, props):
+    """Mimics a vmodl.query.PropertyCollector.ObjectContent"""
+    content = MagicMock()
+    content.obj = obj
+    content.propSet = [make_prop(k, v) for k, v in props.items()]
+    return content
+
+
+def make_vm(moid, name, owner, version='7.4.0.5', state='poweredOn', component='DataDomain'):
+    annotation = ujson.dumps({'component': component, 'version': version})
+    return make_content(inventory.vim.VirtualMachine(moid), {'name': name,
+                                                             'parent': inventory.vim.Folder(owner),
+                                                             'runtime.powerState': state,
+                                                             'config.annotation': annotation,
+                                                             'guest.ipAddress': '10.0.0.1'})
+
+
+class TestInventory(unittest.TestCase):
+    """A set of test cases for inventory.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.fake_vcenter = MagicMock()
+        self.collector = self.fake_vcenter.content.propertyCollector
+        self.view_stub = MagicMock()
+        self.fake_vcenter.content.viewManager.CreateContainerView.return_value = inventory.vim.view.ContainerView('session-1', self.view_stub)
+        self.root = MagicMock()
+        self.root.name = 'vlab'
+        page1 = MagicMock()
+        page1.token = 'more'
+        page1.objects = [make_content(inventory.vim.Folder('group-1'), {'name': 'bob'}),
+                         make_content(inventory.vim.Folder('group-2'), {'name': 'alice'}),
+                         make_vm('vm-1', 'dd1', 'group-1')]
+        page2 = MagicMock()
+        page2.token = None
+        page2.objects = [make_vm('vm-2', 'dd2', 'group-2', version='7.3.0.5', state='poweredOff'),
+                         make_vm('vm-3', 'gateway', 'group-2', component='Gateway'),
+                         make_content(inventory.vim.VirtualMachine('vm-4'), {'name': 'deploying',
+                                                                             'parent': inventory.vim.Folder('group-1')})]
+        self.collector.RetrievePropertiesEx.return_value = page1
+        self.collector.ContinueRetrievePropertiesEx.return_value = page2
+
+    def test_list_datadomains(self):
+        """``list_datadomains`` returns only DataDomains, sorted by owner"""
+        output = inventory.list_datadomains(self.fake_vcenter, self.root)
+        names = [(x['owner'], x['name']) for x in output]
+        expected = [('alice', 'dd2'), ('bob', 'dd1')]
+
+        self.assertEqual(names, expected)
+
+    def test_list_datadomains_version(self):
+        """``list_datadomains`` supports filtering by version"""
+        output = inventory.list_datadomains(self.fake_vcenter, self.root, version='7.4.0.5')
+        names = [x['name'] for x in output]
+
+        self.assertEqual(names, ['dd1'])
+
+    def test_list_datadomains_state(self):
+        """``list_datadomains`` supports filtering by power state"""
+        output = inventory.list_datadomains(self.fake_vcenter, self.root, state='poweredOff')
+        names = [x['name'] for x in output]
+
+        self.assertEqual(names, ['dd2'])
+
+    def test_find_datadomains(self):
+        """``find_datadomains`` returns only the named DataDomains, with their power state"""
+        output = inventory.find_datadomains(self.fake_vcenter, self.root, ['dd2', 'gateway', 'nope'])
+
+        self.assertEqual(list(output.keys()), ['dd2'])
+        self.assertEqual(output['dd2'][1], 'poweredOff')
+
+    def test_collect_pages(self):
+        """``collect`` follows the continuation token until every page is read"""
+        output = list(inventory.collect(self.fake_vcenter, self.root, inventory.PROPERTIES))
+
+        self.assertEqual(len(output), 6)
+        self.collector.ContinueRetrievePropertiesEx.assert_called_once_with('more')
+
+    def test_collect_destroys_view(self):
+        """``collect`` cleans up the ContainerView"""
+        list(inventory.collect(self.fake_vcenter, self.root, inventory.PROPERTIES))
+        _, info, _ = self.view_stub.InvokeMethod.call_args[0]
+
+        self.assertEqual(info.wsdlName, 'DestroyView')
+
+    def test_collect_one_traversal(self):
+        """``collect`` creates a single ContainerView for the whole tree"""
+        list(inventory.collect(self.fake_vcenter, self.root, inventory.PROPERTIES))
+
+        self.assertEqual(self.fake_vcenter.content.viewManager.CreateContainerView.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
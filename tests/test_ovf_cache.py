@@ -0,0 +1,154 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in ovf_cache.py
+"""
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from vlab_datadomain_api.lib.worker import ovf_cache
+
+OVF = '<Envelope><NetworkSection><Network ovf:name="VM Network"></Network></NetworkSection></Envelope>'
+VMDK = b'0123456789' * 100
+SIZED_OVF = """<Envelope xmlns="http://schemas.dmtf.org/ovf/envelope/1" xmlns:ovf="http://schemas.dmtf.org/ovf/envelope/1"
+                         xmlns:rasd="http://schemas.dmtf.org/wbem/wscim/1/cim-schema/2/CIM_ResourceAllocationSettingData">
+  <DiskSection>
+    <Disk ovf:capacity="250" ovf:capacityAllocationUnits="byte * 2^30" ovf:diskId="vmdisk1"/>
+    <Disk ovf:capacity="10" ovf:capacityAllocationUnits="byte * 2^30" ovf:diskId="vmdisk2"/>
+  </DiskSection>
+  <VirtualSystem>
+    <VirtualHardwareSection>
+      <Item><rasd:ResourceType>4</rasd:ResourceType><rasd:VirtualQuantity>8192</rasd:VirtualQuantity></Item>
+      <Item><rasd:ResourceType>4</rasd:ResourceType><rasd:VirtualQuantity>16384</rasd:VirtualQuantity></Item>
+      <Item><rasd:ResourceType>3</rasd:ResourceType><rasd:VirtualQuantity>4</rasd:VirtualQuantity></Item>
+    </VirtualHardwareSection>
+  </VirtualSystem>
+</Envelope>"""
+
+
+def make_ova(path):
+    """Write a minimal OVA file"""
+    with tarfile.open(path, 'w') as tar:
+        for name, data in (('ddve.ovf', OVF.encode()), ('ddve-disk1.vmdk', VMDK)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+class TestOvfCache(unittest.TestCase):
+    """A set of test cases for ovf_cache.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.ova_path = os.path.join(self.tmp, 'ddve-1.0.0.ova')
+        make_ova(self.ova_path)
+        ovf_cache._CACHE.clear()
+
+    def test_get_descriptor(self):
+        """``get_descriptor`` returns the OVF of the OVA"""
+        descriptor = ovf_cache.get_descriptor(self.ova_path)
+
+        self.assertEqual(descriptor['ovf'], OVF)
+
+    def test_get_descriptor_networks(self):
+        """``get_descriptor`` returns the networks defined in the OVF"""
+        descriptor = ovf_cache.get_descriptor(self.ova_path)
+
+        self.assertEqual(descriptor['networks'], ['VM Network'])
+
+    def test_get_descriptor_disks(self):
+        """``get_descriptor`` returns the size of every VMDK in the OVA"""
+        descriptor = ovf_cache.get_descriptor(self.ova_path)
+
+        self.assertEqual(descriptor['disks']['ddve-disk1.vmdk'][1], len(VMDK))
+
+    def test_deployed_size(self):
+        """``deployed_size`` adds up the disk capacities and the largest memory size"""
+        output = ovf_cache.deployed_size({'ovf': SIZED_OVF})
+        expected = 260 * 1024**3 + 16384 * 1024**2
+
+        self.assertEqual(output, expected)
+
+    def test_deployed_size_bad_ovf(self):
+        """``deployed_size`` raises ValueError if the OVF is not valid XML"""
+        with self.assertRaises(ValueError):
+            ovf_cache.deployed_size({'ovf': '<Envelope>'})
+
+    def test_get_descriptor_missing(self):
+        """``get_descriptor`` raises FileNotFoundError if the OVA does not exist"""
+        with self.assertRaises(FileNotFoundError):
+            ovf_cache.get_descriptor(os.path.join(self.tmp, 'nope.ova'))
+
+    @patch.object(ovf_cache.tarfile, 'open', wraps=tarfile.open)
+    def test_cached(self, fake_open):
+        """``get_descriptor`` only scans the OVA once"""
+        ovf_cache.get_descriptor(self.ova_path)
+        ovf_cache.get_descriptor(self.ova_path)
+
+        self.assertEqual(fake_open.call_count, 1)
+
+    @patch.object(ovf_cache.tarfile, 'open', wraps=tarfile.open)
+    def test_invalidated(self, fake_open):
+        """``get_descriptor`` scans the OVA again if the file changes"""
+        ovf_cache.get_descriptor(self.ova_path)
+        stat = os.stat(self.ova_path)
+        os.utime(self.ova_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        ovf_cache.get_descriptor(self.ova_path)
+
+        self.assertEqual(fake_open.call_count, 2)
+
+    @patch.object(ovf_cache.tarfile, 'open', wraps=tarfile.open)
+    def test_disk_cache(self, fake_open):
+        """``get_descriptor`` reuses descriptors saved to disk by other processes"""
+        fake_const = ovf_cache.const._replace(VLAB_DATADOMAIN_OVF_CACHE_DIR=self.tmp)
+        with patch.object(ovf_cache, 'const', fake_const):
+            ovf_cache.get_descriptor(self.ova_path)
+            ovf_cache._CACHE.clear()
+            descriptor = ovf_cache.get_descriptor(self.ova_path)
+
+        self.assertEqual(fake_open.call_count, 1)
+        self.assertEqual(descriptor['ovf'], OVF)
+
+    def test_cached_ova(self):
+        """``CachedOva`` reads each VMDK straight out of the OVA"""
+        descriptor = ovf_cache.get_descriptor(self.ova_path)
+        ova = ovf_cache.CachedOva(self.ova_path, descriptor)
+        data = ova._disks['ddve-disk1.vmdk'].read()
+        ova.close()
+
+        self.assertEqual(data, VMDK)
+
+    def test_cached_ova_networks(self):
+        """``CachedOva`` has the same networks as the Ova object"""
+        descriptor = ovf_cache.get_descriptor(self.ova_path)
+        ova = ovf_cache.CachedOva(self.ova_path, descriptor)
+        networks = ova.networks
+        ova.close()
+
+        self.assertEqual(networks, ['VM Network'])
+
+    def test_tar_member_chunks(self):
+        """``TarMember`` never reads past the end of the member"""
+        descriptor = ovf_cache.get_descriptor(self.ova_path)
+        ova = ovf_cache.CachedOva(self.ova_path, descriptor)
+        member = ova._disks['ddve-disk1.vmdk']
+        chunks = []
+        chunk = member.read(300)
+        while chunk:
+            chunks.append(chunk)
+            chunk = member.read(300)
+        member.seek(0, 0)
+        ova.close()
+
+        self.assertEqual(b''.join(chunks), VMDK)
+        self.assertEqual(member.tell(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the ownership module
+"""
+import unittest
+
+from vlab_datadomain_api.lib import ownership
+
+
+class TestOwnership(unittest.TestCase):
+    """A set of test cases for the ownership module"""
+
+    def test_new_task_id_unique(self):
+        """``new_task_id`` returns a different id every call"""
+        self.assertNotEqual(ownership.new_task_id('bob'), ownership.new_task_id('bob'))
+
+    def test_owned_by(self):
+        """``owned_by`` returns True for the user the task-id was made for"""
+        task_id = ownership.new_task_id('bob')
+
+        self.assertTrue(ownership.owned_by(task_id, 'bob'))
+
+    def test_owned_by_other_user(self):
+        """``owned_by`` returns False for a different user"""
+        task_id = ownership.new_task_id('alice')
+
+        self.assertFalse(ownership.owned_by(task_id, 'bob'))
+
+    def test_owned_by_plain_id(self):
+        """``owned_by`` returns False for a task-id that was not made by ``new_task_id``"""
+        self.assertFalse(ownership.owned_by('asdf-asdf-asdf', 'bob'))
+
+    def test_owned_by_malformed(self):
+        """``owned_by`` returns False for a task-id without a digest"""
+        self.assertFalse(ownership.owned_by('asdf', 'bob'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the Placement object
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import ujson
+
+from vlab_datadomain_api.lib.worker import placement
+
+GB = 1024 ** 3
+
+
+def make_datastore(name, free, hosts):
+    """Create a fake vim.Datastore"""
+    datastore = MagicMock()
+    datastore.name = name
+    datastore._moId = 'moid-{}'.format(name)
+    datastore.summary.accessible = True
+    datastore.summary.freeSpace = free
+    mounts = []
+    for host_name in hosts:
+        mount = MagicMock()
+        mount.key.name = host_name
+        mount.key._moId = 'moid-{}'.format(host_name)
+        mount.key.runtime.connectionState = 'connected'
+        mount.key.runtime.inMaintenanceMode = False
+        mounts.append(mount)
+    datastore.host = mounts
+    return datastore
+
+
+def heaviest(population, weights):
+    """Stands in for ``random.choices``, always picking the highest weight"""
+    return [population[weights.index(max(weights))]]
+
+
+class TestPlacement(unittest.TestCase):
+    """A set of test cases for the Placement object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.fake_vcenter = MagicMock()
+        self.fake_vcenter.datastores = {}
+        self.fake_vcenter.get_by_type.return_value = [make_datastore('ds1', 100 * GB, ['host1']),
+                                                      make_datastore('ds2', 900 * GB, ['host2', 'host3'])]
+        self.reservations_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.reservations_dir)
+        self.placement = placement.Placement(candidates=['ds1', 'ds2'], refresh=300,
+                                             reservations_dir=self.reservations_dir)
+        patcher = patch.object(placement.random, 'choices', side_effect=heaviest)
+        self.fake_choices = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_choose(self):
+        """``Placement`` - choose() picks the datastore with the most free space"""
+        slot = self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+
+        self.assertEqual(slot.datastore_name, 'ds2')
+
+    def test_choose_datastore_cluster(self):
+        """``Placement`` - choose() considers every datastore in a datastore cluster"""
+        self.fake_vcenter.datastores = {'pod': MagicMock()}
+        self.fake_vcenter.datastores['pod'].childEntity = [make_datastore('ds3', 50 * GB, ['host1'])]
+        self.placement.candidates = ['pod']
+
+        slot = self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+
+        self.assertEqual(slot.datastore_name, 'ds3')
+
+    def test_choose_no_space(self):
+        """``Placement`` - choose() raises ValueError when no datastore has enough space"""
+        with self.assertRaises(ValueError):
+            self.placement.choose(self.fake_vcenter, required_bytes=1000 * GB)
+
+    def test_choose_spreads_hosts(self):
+        """``Placement`` - choose() avoids hosts that already have a deploy in-flight"""
+        first = self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+        second = self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+
+        self.assertNotEqual(first.host_name, second.host_name)
+
+    def test_choose_inflight(self):
+        """``Placement`` - choose() discounts datastores with deploys in-flight"""
+        self.fake_vcenter.get_by_type.return_value = [make_datastore('ds1', 500 * GB, ['host1']),
+                                                      make_datastore('ds2', 600 * GB, ['host2'])]
+        first = self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+        second = self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+
+        self.assertEqual(first.datastore_name, 'ds2')
+        self.assertEqual(second.datastore_name, 'ds1')
+
+    def test_choose_latency(self):
+        """``Placement`` - choose() discounts datastores that have been slow to deploy to"""
+        self.fake_vcenter.get_by_type.return_value = [make_datastore('ds1', 500 * GB, ['host1']),
+                                                      make_datastore('ds2', 600 * GB, ['host2'])]
+        self.placement.release(placement.Slot('ds1', 'host1', None, None), seconds=60)
+        self.placement.release(placement.Slot('ds2', 'host2', None, None), seconds=600)
+        slot = self.placement.choose(self.fake_vcenter, required_bytes=0)
+
+        self.assertEqual(slot.datastore_name, 'ds1')
+
+    def test_cached(self):
+        """``Placement`` - choose() does not query vCenter for every deploy"""
+        self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+        self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+
+        self.assertEqual(self.fake_vcenter.get_by_type.call_count, 1)
+
+    @patch.object(placement.time, 'time')
+    def test_refresh(self, fake_time):
+        """``Placement`` - choose() refreshes the cached datastore info once it's too old"""
+        fake_time.return_value = 1000
+        self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+        fake_time.return_value = 2000
+        self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+
+        self.assertEqual(self.fake_vcenter.get_by_type.call_count, 2)
+
+    @patch.object(placement.time, 'time')
+    def test_refresh_failure(self, fake_time):
+        """``Placement`` - choose() keeps using cached info if vCenter fails during a refresh"""
+        fake_time.return_value = 1000
+        self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+        fake_time.return_value = 2000
+        self.fake_vcenter.get_by_type.side_effect = [RuntimeError('testing')]
+
+        slot = self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+
+        self.assertEqual(slot.datastore_name, 'ds2')
+
+    def test_max_free(self):
+        """``Placement`` - max_free() returns the most free space on any datastore"""
+        free = self.placement.max_free(self.fake_vcenter)
+
+        self.assertEqual(free, 900 * GB)
+
+    def test_max_free_no_hosts(self):
+        """``Placement`` - max_free() ignores datastores without a usable host"""
+        self.fake_vcenter.get_by_type.return_value = [make_datastore('ds1', 100 * GB, ['host1']),
+                                                      make_datastore('ds2', 900 * GB, [])]
+        free = self.placement.max_free(self.fake_vcenter)
+
+        self.assertEqual(free, 100 * GB)
+
+    def test_release(self):
+        """``Placement`` - release() frees the in-flight reservation"""
+        slot = self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+        self.placement.release(slot)
+
+        self.assertEqual(os.listdir(self.reservations_dir), [])
+
+    def test_choose_weighted(self):
+        """``Placement`` - choose() gives every datastore a chance, weighted by its score"""
+        self.placement.choose(self.fake_vcenter, required_bytes=0)
+        _, the_kwargs = self.fake_choices.call_args
+
+        self.assertEqual(sorted(the_kwargs['weights']), [100 * GB, 900 * GB])
+
+    def test_choose_other_processes(self):
+        """``Placement`` - choose() counts the deploys in-flight from other worker processes"""
+        self.fake_vcenter.get_by_type.return_value = [make_datastore('ds1', 500 * GB, ['host1']),
+                                                      make_datastore('ds2', 600 * GB, ['host2'])]
+        reservation = {'datastore': 'ds2', 'host': 'host2', 'bytes': 10 * GB, 'started': placement.time.time()}
+        path = os.path.join(self.reservations_dir, '{}.other.json'.format(os.getppid()))
+        with open(path, 'w') as the_file:
+            ujson.dump(reservation, the_file)
+
+        slot = self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+
+        self.assertEqual(slot.datastore_name, 'ds1')
+
+    def test_choose_other_processes_space(self):
+        """``Placement`` - choose() leaves the space other worker processes reserved"""
+        reservation = {'datastore': 'ds2', 'host': 'host2', 'bytes': 850 * GB, 'started': placement.time.time()}
+        path = os.path.join(self.reservations_dir, '{}.other.json'.format(os.getppid()))
+        with open(path, 'w') as the_file:
+            ujson.dump(reservation, the_file)
+
+        with self.assertRaises(ValueError):
+            self.placement.choose(self.fake_vcenter, required_bytes=200 * GB)
+
+    @patch.object(placement, '_alive')
+    def test_stale_reservation(self, fake_alive):
+        """``Placement`` - choose() drops reservations left behind by dead processes"""
+        fake_alive.return_value = False
+        path = os.path.join(self.reservations_dir, '1234.other.json')
+        with open(path, 'w') as the_file:
+            ujson.dump({'datastore': 'ds2', 'host': 'host2', 'bytes': 0, 'started': placement.time.time()}, the_file)
+
+        self.placement.choose(self.fake_vcenter, required_bytes=10 * GB)
+
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the HealthProber object
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+import ujson
+
+from vlab_datadomain_api.lib import prober
+
+
+class TestHealthProber(unittest.TestCase):
+    """A set of test cases for the HealthProber object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.fake_celery = MagicMock()
+        self.fake_celery.control.ping.return_value = [{'worker1': {'ok': 'pong'}}]
+        fake_conn = self.fake_celery.connection_for_write.return_value.__enter__.return_value
+        fake_conn.default_channel.queue_declare.return_value.message_count = 0
+        self.fake_celery.send_task.return_value.get.return_value = {'content': {'images_dir': True}}
+        self.prober = prober.HealthProber(celery_app=self.fake_celery, interval=1, timeout=1)
+
+    def test_probe(self):
+        """``HealthProber`` - probe() reports healthy when every check passes"""
+        status = self.prober.probe()
+
+        self.assertTrue(status['healthy'])
+
+    def test_probe_checks(self):
+        """``HealthProber`` - probe() reports the broker, workers, queue and images dir"""
+        status = self.prober.probe()
+        expected = {'broker', 'workers', 'queue', 'images_dir'}
+
+        self.assertEqual(set(status['checks'].keys()), expected)
+
+    def test_probe_broker_down(self):
+        """``HealthProber`` - probe() reports unhealthy when the broker is unreachable"""
+        self.fake_celery.connection_for_write.side_effect = [OSError('testing')]
+        status = self.prober.probe()
+
+        self.assertFalse(status['healthy'])
+
+    def test_probe_no_workers(self):
+        """``HealthProber`` - probe() reports unhealthy when no workers answer a ping"""
+        self.fake_celery.control.ping.return_value = []
+        status = self.prober.probe()
+
+        self.assertFalse(status['healthy'])
+
+    def test_probe_no_images(self):
+        """``HealthProber`` - probe() reports unhealthy when workers cannot read the images dir"""
+        self.fake_celery.send_task.return_value.get.return_value = {'content': {'images_dir': False}}
+        status = self.prober.probe()
+
+        self.assertFalse(status['healthy'])
+
+    def test_probe_busy_workers(self):
+        """``HealthProber`` - probe() does not fail when workers are too busy to run the probe task"""
+        self.fake_celery.send_task.return_value.get.side_effect = [TimeoutError('testing')]
+        status = self.prober.probe()
+
+        self.assertTrue(status['healthy'])
+
+    def test_serialize_not_probed(self):
+        """``HealthProber`` - serialize() returns HTTP 200 before the first probe completes"""
+        _, status = self.prober.serialize({'version': '1.0'})
+
+        self.assertEqual(status, 200)
+
+    def test_serialize_unhealthy(self):
+        """``HealthProber`` - serialize() returns HTTP 503 when unhealthy"""
+        self.fake_celery.control.ping.return_value = []
+        self.prober.probe()
+        body, status = self.prober.serialize({'version': '1.0'})
+
+        self.assertEqual(status, 503)
+        self.assertEqual(ujson.loads(body)['version'], '1.0')
+
+    @patch.object(prober.time, 'time')
+    def test_serialize_stale(self, fake_time):
+        """``HealthProber`` - serialize() returns HTTP 503 when the cached results are stale"""
+        fake_time.return_value = 100
+        self.prober.probe()
+        fake_time.return_value = 100000
+        _, status = self.prober.serialize({'version': '1.0'})
+
+        self.assertEqual(status, 503)
+
+    def test_images_unknown(self):
+        """``HealthProber`` - has_image() allows any image until a worker reports"""
+        self.assertTrue(self.prober.has_image('1.2.3'))
+
+    def test_images(self):
+        """``HealthProber`` - probe() records the images a worker reported"""
+        self.fake_celery.send_task.return_value.get.return_value = {'content': {'images_dir': True, 'images': ['1.2.3']}}
+        self.prober.probe()
+
+        self.assertTrue(self.prober.has_image('1.2.3'))
+        self.assertFalse(self.prober.has_image('4.5.6'))
+
+    def test_images_kept(self):
+        """``HealthProber`` - probe() keeps the last images index when workers do not answer"""
+        self.fake_celery.send_task.return_value.get.return_value = {'content': {'images_dir': True, 'images': ['1.2.3']}}
+        self.prober.probe()
+        self.fake_celery.send_task.return_value.get.side_effect = [RuntimeError('testing')]
+        self.prober.probe()
+
+        self.assertTrue(self.prober.has_image('1.2.3'))
+
+
+if __name__ == '__main__':
+    unittest.main()
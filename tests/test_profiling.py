@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in profiling.py
+"""
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from vlab_datadomain_api.lib.worker import profiling
+
+
+class TestProfiling(unittest.TestCase):
+    """A set of test cases for profiling.py"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.profile_dir = tempfile.mkdtemp()
+        patcher = patch.object(profiling, 'const')
+        self.fake_const = patcher.start()
+        self.fake_const.VLAB_DATADOMAIN_PROFILE_DIR = self.profile_dir
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+
+    def test_capture(self):
+        """``capture`` saves a profile that ``load`` can read back"""
+        with profiling.capture('bob', 'myId', 'datadomain.show', enabled=True):
+            sum(range(100))
+
+        output = profiling.load('bob', 'myId')
+
+        self.assertEqual(output['task'], 'datadomain.show')
+        self.assertTrue(output['functions'])
+
+    def test_capture_disabled(self):
+        """``capture`` saves nothing when not enabled"""
+        with profiling.capture('bob', 'myId', 'datadomain.show'):
+            sum(range(100))
+
+        with self.assertRaises(ValueError):
+            profiling.load('bob', 'myId')
+
+    def test_capture_error(self):
+        """``capture`` saves the profile when the profiled code raises"""
+        with self.assertRaises(ValueError):
+            with profiling.capture('bob', 'myId', 'datadomain.create', enabled=True):
+                raise ValueError('testing')
+
+        output = profiling.load('bob', 'myId')
+
+        self.assertEqual(output['task'], 'datadomain.create')
+
+    def test_round_trips(self):
+        """``capture`` counts the requests sent to vCenter"""
+        stub = profiling.SoapStubAdapter.__new__(profiling.SoapStubAdapter)
+        with profiling.capture('bob', 'myId', 'datadomain.show', enabled=True):
+            for _ in range(3):
+                try:
+                    # Not connected, so this fails right away; it still counts
+                    stub.InvokeMethod(None, None, None)
+                except Exception:
+                    pass
+
+        output = profiling.load('bob', 'myId')
+
+        self.assertEqual(output['vcenter_round_trips'], 3)
+
+    def test_load_path(self):
+        """``load`` ignores directories within the txn_id"""
+        with profiling.capture('bob', 'myId', 'datadomain.show', enabled=True):
+            pass
+
+        output = profiling.load('bob', '../../myId')
+
+        self.assertEqual(output['task'], 'datadomain.show')
+
+
+    def test_load_other_user(self):
+        """``load`` only finds the profiles of the user asking"""
+        with profiling.capture('bob', 'myId', 'datadomain.show', enabled=True):
+            pass
+
+        with self.assertRaises(ValueError):
+            profiling.load('alice', 'myId')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in resilience.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_datadomain_api.lib.worker import resilience
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """A set of test cases for the CircuitBreaker object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.breaker = resilience.CircuitBreaker(threshold=2, reset_timeout=60)
+
+    def test_closed(self):
+        """``CircuitBreaker`` - allows calls by default"""
+        self.breaker.before_call()
+
+        self.assertFalse(self.breaker.is_open)
+
+    def test_opens(self):
+        """``CircuitBreaker`` - opens after ``threshold`` failures in a row"""
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        with self.assertRaises(resilience.CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_success_resets(self):
+        """``CircuitBreaker`` - a success resets the count of failures"""
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+
+        self.assertFalse(self.breaker.is_open)
+
+    @patch.object(resilience.time, 'time')
+    def test_half_open(self, fake_time):
+        """``CircuitBreaker`` - allows a single trial call once ``reset_timeout`` passes"""
+        fake_time.return_value = 100
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        fake_time.return_value = 200
+
+        self.breaker.before_call()
+        with self.assertRaises(resilience.CircuitOpenError):
+            self.breaker.before_call()
+
+    @patch.object(resilience.time, 'time')
+    def test_half_open_failure(self, fake_time):
+        """``CircuitBreaker`` - a failed trial call opens the circuit again"""
+        fake_time.return_value = 100
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        fake_time.return_value = 200
+        self.breaker.before_call()
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.retry_after, 61)
+
+    def test_circuit_open_is_value_error(self):
+        """``CircuitOpenError`` is handled like any other user-facing error by the tasks"""
+        self.assertTrue(issubclass(resilience.CircuitOpenError, ValueError))
+
+
+class TestVsphereCall(unittest.TestCase):
+    """A set of test cases for the ``vsphere_call`` function"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.breaker = resilience.CircuitBreaker(threshold=10, reset_timeout=60)
+        patcher = patch.object(resilience, 'BREAKER', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ok(self):
+        """``vsphere_call`` returns what the function returns"""
+        output = resilience.vsphere_call(lambda x: x * 2, 2)
+
+        self.assertEqual(output, 4)
+
+    @patch.object(resilience.time, 'sleep')
+    def test_retries(self, fake_sleep):
+        """``vsphere_call`` retries transient faults"""
+        func = MagicMock()
+        func.side_effect = [ConnectionResetError('testing'), 'worked']
+
+        output = resilience.vsphere_call(func)
+
+        self.assertEqual(output, 'worked')
+
+    @patch.object(resilience.time, 'sleep')
+    def test_retries_exhausted(self, fake_sleep):
+        """``vsphere_call`` raises the transient fault once out of retries"""
+        func = MagicMock()
+        func.side_effect = ConnectionResetError('testing')
+
+        with self.assertRaises(ConnectionResetError):
+            resilience.vsphere_call(func)
+
+    @patch.object(resilience.time, 'sleep')
+    def test_not_idempotent(self, fake_sleep):
+        """``vsphere_call`` only makes one attempt when ``idempotent`` is False"""
+        func = MagicMock()
+        func.side_effect = ConnectionResetError('testing')
+
+        with self.assertRaises(ConnectionResetError):
+            resilience.vsphere_call(func, idempotent=False)
+
+        self.assertEqual(func.call_count, 1)
+
+    def test_other_errors(self):
+        """``vsphere_call`` does not retry errors that are not transient"""
+        func = MagicMock()
+        func.side_effect = ValueError('testing')
+
+        with self.assertRaises(ValueError):
+            resilience.vsphere_call(func)
+
+        self.assertEqual(func.call_count, 1)
+
+    def test_system_error(self):
+        """``vsphere_call`` does not retry a vCenter SystemError, it's a real failure"""
+        func = MagicMock()
+        func.side_effect = resilience.vmodl.fault.SystemError(msg='testing')
+
+        with self.assertRaises(resilience.vmodl.fault.SystemError):
+            resilience.vsphere_call(func)
+
+        self.assertEqual(func.call_count, 1)
+
+    @patch.object(resilience.time, 'sleep')
+    def test_fail_fast(self, fake_sleep):
+        """``vsphere_call`` stops calling vCenter once the circuit opens"""
+        self.breaker.threshold = 2
+        func = MagicMock()
+        func.side_effect = ConnectionResetError('testing')
+
+        with self.assertRaises(resilience.CircuitOpenError):
+            resilience.vsphere_call(func)
+
+        self.assertEqual(func.call_count, 2)
+
+    def test_backoff(self):
+        """``backoff`` never waits longer than MAX_BACKOFF"""
+        self.assertTrue(resilience.backoff(100) <= resilience.MAX_BACKOFF)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the production server entry point
+"""
+import unittest
+from unittest.mock import patch
+
+from vlab_datadomain_api import server
+
+
+class TestServer(unittest.TestCase):
+    """A set of test cases for server.py"""
+
+    def test_uwsgi_args(self):
+        """``uwsgi_args`` sizes the processes and threads from the constants"""
+        args = server.uwsgi_args(ini='/some/app.ini')
+        processes = args[args.index('--processes') + 1]
+        threads = args[args.index('--threads') + 1]
+
+        self.assertEqual(processes, str(server.const.VLAB_DATADOMAIN_API_PROCESSES))
+        self.assertEqual(threads, str(server.const.VLAB_DATADOMAIN_API_THREADS))
+
+    def test_uwsgi_args_ini(self):
+        """``uwsgi_args`` loads the supplied uWSGI config file"""
+        args = server.uwsgi_args(ini='/some/app.ini')
+
+        self.assertEqual(args[args.index('--ini') + 1], '/some/app.ini')
+
+    @patch.object(server.os, 'chdir')
+    @patch.object(server.os, 'execvp')
+    def test_main(self, fake_execvp, fake_chdir):
+        """``main`` replaces the current process with uWSGI"""
+        server.main()
+
+        the_args, _ = fake_execvp.call_args
+        self.assertEqual(the_args[0], 'uwsgi')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,8 @@ A suite of tests for the functions in tasks.py
 import unittest
 from unittest.mock import patch, MagicMock
 
+from celery.exceptions import Retry, SoftTimeLimitExceeded
+
 from vlab_datadomain_api.lib.worker import tasks
 
 
@@ -30,6 +32,26 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'vmware')
+    def test_show_vcenter_unavailable(self, fake_vmware):
+        """``show`` reports vCenter as unavailable when a transient fault outlasts the retries"""
+        fake_vmware.show_datadomain.side_effect = [ConnectionError('testing')]
+
+        output = tasks.show(username='bob', txn_id='myId')
+        expected = {'content' : {}, 'error': 'vCenter unavailable: testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_show_cancelled(self, fake_vmware):
+        """``show`` reports that it was cancelled"""
+        fake_vmware.show_datadomain.side_effect = [SoftTimeLimitExceeded()]
+
+        output = tasks.show(username='bob', txn_id='myId')
+        expected = {'content' : {}, 'error': 'Task cancelled', 'params': {}}
+
+        self.assertEqual(output, expected)
+
     @patch.object(tasks, 'vmware')
     def test_create_ok(self, fake_vmware):
         """``create`` returns a dictionary when everything works as expected"""
@@ -58,6 +80,34 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'vmware')
+    def test_create_vcenter_unavailable(self, fake_vmware):
+        """``create`` reports vCenter as unavailable when a transient fault outlasts the retries"""
+        fake_vmware.create_datadomain.side_effect = [ConnectionError('testing')]
+
+        output = tasks.create(username='bob',
+                              machine_name='datadomainBox',
+                              image='0.0.1',
+                              network='someLAN',
+                              txn_id='myId')
+        expected = {'content' : {}, 'error': 'vCenter unavailable: testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'BREAKER')
+    @patch.object(tasks, 'vmware')
+    def test_create_deferred(self, fake_vmware, fake_BREAKER):
+        """``create`` is put back on the queue while the vCenter circuit breaker is open"""
+        fake_BREAKER.is_open = True
+        fake_BREAKER.retry_after = 30
+
+        with self.assertRaises(Retry):
+            tasks.create(username='bob',
+                         machine_name='datadomainBox',
+                         image='0.0.1',
+                         network='someLAN',
+                         txn_id='myId')
+
     @patch.object(tasks, 'vmware')
     def test_delete_ok(self, fake_vmware):
         """``delete`` returns a dictionary when everything works as expected"""
@@ -78,6 +128,142 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'vmware')
+    def test_delete_vcenter_unavailable(self, fake_vmware):
+        """``delete`` reports vCenter as unavailable when a transient fault outlasts the retries"""
+        fake_vmware.delete_datadomain.side_effect = [ConnectionError('testing')]
+
+        output = tasks.delete(username='bob', machine_name='datadomainBox', txn_id='myId')
+        expected = {'content' : {}, 'error': 'vCenter unavailable: testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_cancelled(self, fake_vmware):
+        """``delete`` reports that it was cancelled"""
+        fake_vmware.delete_datadomain.side_effect = [SoftTimeLimitExceeded()]
+
+        output = tasks.delete(username='bob', machine_name='datadomainBox', txn_id='myId')
+        expected = {'content' : {}, 'error': 'Task cancelled', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'delete_poll')
+    @patch.object(tasks, 'vmware')
+    def test_delete_no_wait(self, fake_vmware, fake_delete_poll):
+        """``delete`` returns the id of the tracking task when not waiting on the destroy"""
+        fake_delete_poll.apply_async.return_value.id = 'tracker-id'
+
+        output = tasks.delete(username='bob', machine_name='datadomainBox', txn_id='myId', wait=False)
+        expected = {'content' : {'state': 'deleting', 'tracker': 'tracker-id'}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+        self.assertFalse(fake_vmware.delete_datadomain.called)
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_poll_done(self, fake_vmware):
+        """``delete_poll`` returns once the VM is destroyed"""
+        fake_vmware.check_delete.return_value = {'vm': 'vm-1', 'task': 'task-2', 'stage': 'done'}
+
+        output = tasks.delete_poll(username='bob', machine_name='datadomainBox',
+                                   progress={'vm': 'vm-1', 'task': 'task-2', 'stage': 'destroy'}, txn_id='myId')
+        expected = {'content' : {}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_poll_pending(self, fake_vmware):
+        """``delete_poll`` goes back on the queue while vCenter is still working"""
+        fake_vmware.check_delete.return_value = {'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}
+
+        with self.assertRaises(Retry):
+            tasks.delete_poll(username='bob', machine_name='datadomainBox',
+                              progress={'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}, txn_id='myId')
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_poll_circuit_open(self, fake_vmware):
+        """``delete_poll`` checks again later, with the same progress, while vCenter calls are rejected"""
+        fake_vmware.check_delete.side_effect = [tasks.CircuitOpenError('testing')]
+        progress = {'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}
+
+        with patch.object(tasks.delete_poll, 'retry') as fake_retry:
+            fake_retry.return_value = Retry()
+            with self.assertRaises(Retry):
+                tasks.delete_poll(username='bob', machine_name='datadomainBox', progress=progress, txn_id='myId')
+        _, the_kwargs = fake_retry.call_args
+
+        self.assertEqual(the_kwargs['args'], ['bob', 'datadomainBox', progress, 'myId'])
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_poll_transient_fault(self, fake_vmware):
+        """``delete_poll`` checks again later when vCenter cannot be reached"""
+        fake_vmware.check_delete.side_effect = [ConnectionResetError('testing')]
+
+        with self.assertRaises(Retry):
+            tasks.delete_poll(username='bob', machine_name='datadomainBox',
+                              progress={'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}, txn_id='myId')
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_poll_value_error(self, fake_vmware):
+        """``delete_poll`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.check_delete.side_effect = [ValueError('testing')]
+
+        output = tasks.delete_poll(username='bob', machine_name='datadomainBox',
+                                   progress={'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}, txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'BREAKER')
+    @patch.object(tasks, 'vmware')
+    def test_delete_deferred(self, fake_vmware, fake_BREAKER):
+        """``delete`` is put back on the queue while the vCenter circuit breaker is open"""
+        fake_BREAKER.is_open = True
+        fake_BREAKER.retry_after = 30
+
+        with self.assertRaises(Retry):
+            tasks.delete(username='bob', machine_name='datadomainBox', txn_id='myId')
+
+    @patch.object(tasks, 'vmware')
+    def test_reset_ok(self, fake_vmware):
+        """``reset`` returns a dictionary when everything works as expected"""
+        fake_vmware.reset_datadomain.return_value = {'worked': True}
+
+        output = tasks.reset(username='bob', machine_name='datadomainBox', txn_id='myId')
+        expected = {'content' : {'worked': True}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_reset_value_error(self, fake_vmware):
+        """``reset`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.reset_datadomain.side_effect = [ValueError("testing")]
+
+        output = tasks.reset(username='bob', machine_name='datadomainBox', txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_reset_vcenter_unavailable(self, fake_vmware):
+        """``reset`` reports vCenter as unavailable when a transient fault outlasts the retries"""
+        fake_vmware.reset_datadomain.side_effect = [ConnectionError('testing')]
+
+        output = tasks.reset(username='bob', machine_name='datadomainBox', txn_id='myId')
+        expected = {'content' : {}, 'error': 'vCenter unavailable: testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_reset_cancelled(self, fake_vmware):
+        """``reset`` reports that it was cancelled"""
+        fake_vmware.reset_datadomain.side_effect = [SoftTimeLimitExceeded()]
+
+        output = tasks.reset(username='bob', machine_name='datadomainBox', txn_id='myId')
+        expected = {'content' : {}, 'error': 'Task cancelled', 'params': {}}
+
+        self.assertEqual(output, expected)
+
     @patch.object(tasks, 'vmware')
     def test_image(self, fake_vmware):
         """``image`` returns a dictionary when everything works as expected"""
@@ -88,6 +274,125 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'vmware')
+    def test_image_cancelled(self, fake_vmware):
+        """``image`` reports that it was cancelled"""
+        fake_vmware.list_images.side_effect = [SoftTimeLimitExceeded()]
+
+        output = tasks.image(txn_id='myId')
+        expected = {'content' : {}, 'error': 'Task cancelled', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_power(self, fake_vmware):
+        """``power`` returns the outcome for every VM"""
+        fake_vmware.power_datadomains.return_value = {'dd1': {'ok': True, 'seconds': 1.0, 'error': None}}
+
+        output = tasks.power(username='bob', machine_names=['dd1'], state='on', txn_id='myId')
+        expected = {'content' : {'dd1': {'ok': True, 'seconds': 1.0, 'error': None}}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_power_value_error(self, fake_vmware):
+        """``power`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.power_datadomains.side_effect = [ValueError('testing')]
+
+        output = tasks.power(username='bob', machine_names=['dd1'], state='on', txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_power_vcenter_unavailable(self, fake_vmware):
+        """``power`` reports vCenter as unavailable when a transient fault outlasts the retries"""
+        fake_vmware.power_datadomains.side_effect = [ConnectionError('testing')]
+
+        output = tasks.power(username='bob', machine_names=['dd1'], state='on', txn_id='myId')
+        expected = {'content' : {}, 'error': 'vCenter unavailable: testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_power_cancelled(self, fake_vmware):
+        """``power`` reports that it was cancelled"""
+        fake_vmware.power_datadomains.side_effect = [SoftTimeLimitExceeded()]
+
+        output = tasks.power(username='bob', machine_names=['dd1'], state='on', txn_id='myId')
+        expected = {'content' : {}, 'error': 'Task cancelled', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_inventory(self, fake_vmware):
+        """``inventory`` returns a dictionary when everything works as expected"""
+        fake_vmware.inventory_datadomain.return_value = {'total': 0, 'vms': []}
+
+        output = tasks.inventory(version=None, state=None, offset=0, limit=10, txn_id='myId')
+        expected = {'content' : {'total': 0, 'vms': []}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_inventory_value_error(self, fake_vmware):
+        """``inventory`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.inventory_datadomain.side_effect = [ValueError('testing')]
+
+        output = tasks.inventory(version=None, state=None, offset=0, limit=10, txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_inventory_vcenter_unavailable(self, fake_vmware):
+        """``inventory`` reports vCenter as unavailable when a transient fault outlasts the retries"""
+        fake_vmware.inventory_datadomain.side_effect = [ConnectionError('testing')]
+
+        output = tasks.inventory(version=None, state=None, offset=0, limit=10, txn_id='myId')
+        expected = {'content' : {}, 'error': 'vCenter unavailable: testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'profiling')
+    @patch.object(tasks, 'vmware')
+    def test_show_profile(self, fake_vmware, fake_profiling):
+        """``show`` profiles the task when asked to"""
+        tasks.show(username='bob', txn_id='myId', profile=True)
+
+        fake_profiling.capture.assert_called_with('bob', 'myId', 'datadomain.show', enabled=True)
+
+    @patch.object(tasks, 'profiling')
+    def test_fetch_profile(self, fake_profiling):
+        """``fetch_profile`` returns the saved profile"""
+        fake_profiling.load.return_value = {'task': 'datadomain.show'}
+
+        output = tasks.fetch_profile(username='bob', profiled_txn_id='someId', txn_id='myId')
+        expected = {'content' : {'task': 'datadomain.show'}, 'error': None, 'params' : {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'profiling')
+    def test_fetch_profile_missing(self, fake_profiling):
+        """``fetch_profile`` sets the error when there is no saved profile"""
+        fake_profiling.load.side_effect = [ValueError('testing')]
+
+        output = tasks.fetch_profile(username='bob', profiled_txn_id='someId', txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params' : {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_health(self, fake_vmware):
+        """``health`` reports if the images directory is available, and what images it holds"""
+        fake_vmware.images_available.return_value = True
+        fake_vmware.list_images.return_value = ['1.2.3']
+
+        output = tasks.health(txn_id='myId')
+        expected = {'content' : {'images_dir' : True, 'images' : ['1.2.3']}, 'error': None, 'params' : {}}
+
+        self.assertEqual(output, expected)
+
 
 if __name__ == '__main__':
     unittest.main()
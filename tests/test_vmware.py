@@ -6,6 +6,21 @@ import unittest
 from unittest.mock import patch, MagicMock
 
 from vlab_datadomain_api.lib.worker import vmware
+from vlab_datadomain_api.lib.worker.placement import Slot
+
+
+def make_task_content(task, state, error=None):
+    """Mimics the ObjectContent the PropertyCollector returns for a vim.Task"""
+    content = MagicMock()
+    content.obj = task
+    props = {'info.state': state, 'info.error': error}
+    content.propSet = []
+    for name, val in props.items():
+        prop = MagicMock()
+        prop.name = name
+        prop.val = val
+        content.propSet.append(prop)
+    return content
 
 
 class TestVMware(unittest.TestCase):
@@ -79,19 +94,23 @@ class TestVMware(unittest.TestCase):
         with self.assertRaises(ValueError):
             vmware.delete_datadomain(username='bob', machine_name='myOtherDataDomainBox', logger=fake_logger)
 
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware.virtual_machine, 'power')
     @patch.object(vmware.virtual_machine, 'add_vmdk')
     @patch.object(vmware.virtual_machine, 'set_meta')
-    @patch.object(vmware, 'Ova')
+    @patch.object(vmware, 'ovf_cache')
     @patch.object(vmware.virtual_machine, 'get_info')
     @patch.object(vmware.virtual_machine, 'deploy_from_ova')
     @patch.object(vmware, 'consume_task')
     @patch.object(vmware, 'vCenter')
-    def test_create_datadomain(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_Ova, fake_set_meta, fake_add_vmdk):
+    def test_create_datadomain(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_ovf_cache, fake_set_meta, fake_add_vmdk, fake_power, fake_PLACEMENT):
         """``create_datadomain`` returns a dictionary upon success"""
         fake_logger = MagicMock()
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
         fake_deploy_from_ova.return_value.name = 'myDataDomain'
         fake_get_info.return_value = {'worked': True}
-        fake_Ova.return_value.networks = ['someLAN']
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
         fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
 
 
@@ -104,16 +123,389 @@ class TestVMware(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
-    @patch.object(vmware, 'Ova')
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, 'add_vmdk')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'ovf_cache')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_placement(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_ovf_cache, fake_set_meta, fake_add_vmdk, fake_power, fake_PLACEMENT):
+        """``create_datadomain`` records where the new VM was placed in the meta data"""
+        fake_logger = MagicMock()
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
+        fake_PLACEMENT.choose.return_value = Slot('ds1', 'host1', 'datastore-1', 'host-1')
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        vmware.create_datadomain(username='alice',
+                                 machine_name='DataDomainBox',
+                                 image='1.0.0',
+                                 network='someLAN',
+                                 logger=fake_logger)
+        meta = fake_set_meta.call_args[0][1]
+        expected = {'datastore': 'ds1', 'host': 'host1'}
+
+        self.assertEqual(meta['placement'], expected)
+
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, 'add_vmdk')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'ovf_cache')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_deploy(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_ovf_cache, fake_set_meta, fake_add_vmdk, fake_power, fake_PLACEMENT):
+        """``create_datadomain`` deploys to the chosen slot, and reserves the deployed size of the image"""
+        fake_logger = MagicMock()
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
+        fake_PLACEMENT.choose.return_value = Slot('ds1', 'host1', 'datastore-1', 'host-1')
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        vmware.create_datadomain(username='alice',
+                                 machine_name='DataDomainBox',
+                                 image='1.0.0',
+                                 network='someLAN',
+                                 logger=fake_logger)
+        _, the_kwargs = fake_deploy_from_ova.call_args
+        _, choose_kwargs = fake_PLACEMENT.choose.call_args
+
+        self.assertTrue(isinstance(the_kwargs['vcenter'], vmware._PlacedVCenter))
+        self.assertFalse(the_kwargs['power_on'])
+        self.assertEqual(choose_kwargs['required_bytes'], 1024)
+
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware, 'ovf_cache')
+    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_release(self, fake_vCenter, fake_deploy_from_ova, fake_ovf_cache, fake_PLACEMENT):
+        """``create_datadomain`` releases the placement slot when the deploy fails"""
+        fake_logger = MagicMock()
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
+        fake_deploy_from_ova.side_effect = [RuntimeError('testing')]
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        with self.assertRaises(RuntimeError):
+            vmware.create_datadomain(username='alice',
+                                     machine_name='DataDomainBox',
+                                     image='1.0.0',
+                                     network='someLAN',
+                                     logger=fake_logger)
+
+        self.assertTrue(fake_PLACEMENT.release.called)
+
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware, 'ovf_cache')
+    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_cancel_upload(self, fake_vCenter, fake_deploy_from_ova, fake_ovf_cache, fake_power, fake_PLACEMENT):
+        """``create_datadomain`` raises ValueError when cancelled while uploading the OVA"""
+        fake_logger = MagicMock()
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
+        fake_deploy_from_ova.side_effect = [vmware.SoftTimeLimitExceeded()]
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        with self.assertRaises(ValueError):
+            vmware.create_datadomain(username='alice',
+                                     machine_name='DataDomainBox',
+                                     image='1.0.0',
+                                     network='someLAN',
+                                     logger=fake_logger)
+
+        self.assertTrue(fake_ovf_cache.CachedOva.return_value.close.called)
+
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, 'add_vmdk')
+    @patch.object(vmware, 'ovf_cache')
+    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_cancel_destroys(self, fake_vCenter, fake_deploy_from_ova, fake_ovf_cache, fake_add_vmdk, fake_power, fake_PLACEMENT):
+        """``create_datadomain`` destroys the partially built VM when cancelled after the upload"""
+        fake_logger = MagicMock()
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
+        fake_add_vmdk.side_effect = [vmware.SoftTimeLimitExceeded()]
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        with self.assertRaises(ValueError):
+            vmware.create_datadomain(username='alice',
+                                     machine_name='DataDomainBox',
+                                     image='1.0.0',
+                                     network='someLAN',
+                                     logger=fake_logger)
+
+        self.assertTrue(fake_deploy_from_ova.return_value.Destroy_Task.called)
+
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, 'add_vmdk')
+    @patch.object(vmware, 'ovf_cache')
+    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_circuit_open_destroys(self, fake_vCenter, fake_deploy_from_ova, fake_ovf_cache, fake_add_vmdk, fake_power, fake_PLACEMENT):
+        """``create_datadomain`` destroys the partially built VM if the circuit opens after the upload"""
+        fake_logger = MagicMock()
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
+        fake_add_vmdk.side_effect = [vmware.CircuitOpenError('testing')]
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        with self.assertRaises(vmware.CircuitOpenError):
+            vmware.create_datadomain(username='alice',
+                                     machine_name='DataDomainBox',
+                                     image='1.0.0',
+                                     network='someLAN',
+                                     logger=fake_logger)
+
+        self.assertTrue(fake_deploy_from_ova.return_value.Destroy_Task.called)
+
+    def test_discard_vm_errors(self):
+        """``discard_vm`` logs, rather than raises, when vCenter won't cooperate"""
+        fake_logger = MagicMock()
+        fake_vm = MagicMock()
+        fake_vm.PowerOffVM_Task.side_effect = [ConnectionResetError('testing')]
+
+        vmware.discard_vm(fake_vm, fake_logger)
+
+        self.assertTrue(fake_logger.error.called)
+
+    @patch.object(vmware.time, 'sleep')
+    @patch.object(vmware.time, 'time')
+    def test_discard_vm_power_timeout(self, fake_time, fake_sleep):
+        """``discard_vm`` gives up on a VM that won't power off"""
+        fake_logger = MagicMock()
+        fake_time.side_effect = [0, 1, vmware.DISCARD_TIMEOUT + 1]
+        fake_vm = MagicMock()
+        fake_vm.PowerOffVM_Task.return_value.info.state = 'running'
+
+        vmware.discard_vm(fake_vm, fake_logger)
+
+        self.assertFalse(fake_vm.Destroy_Task.called)
+        self.assertTrue(fake_logger.error.called)
+
+    def test_discard_vm_powered_off(self):
+        """``discard_vm`` destroys a powered off VM without powering it off first"""
+        fake_logger = MagicMock()
+        fake_vm = MagicMock()
+        fake_vm.runtime.powerState = 'poweredOff'
+
+        vmware.discard_vm(fake_vm, fake_logger)
+
+        self.assertFalse(fake_vm.PowerOffVM_Task.called)
+        self.assertTrue(fake_vm.Destroy_Task.called)
+
+    def test_abort_lease(self):
+        """``abort_lease`` aborts a lease that's still usable"""
+        fake_lease = MagicMock()
+        fake_lease.state = 'initializing'
+
+        vmware.abort_lease(fake_lease, MagicMock())
+
+        self.assertTrue(fake_lease.HttpNfcLeaseAbort.called)
+
+    def test_abort_lease_done(self):
+        """``abort_lease`` leaves a finished lease alone"""
+        fake_lease = MagicMock()
+        fake_lease.state = 'done'
+
+        vmware.abort_lease(fake_lease, MagicMock())
+
+        self.assertFalse(fake_lease.HttpNfcLeaseAbort.called)
+
+    @patch.object(vmware.vim.ResourcePool, 'ImportVApp')
+    @patch.object(vmware, 'abort_lease')
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware, 'ovf_cache')
+    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_cancel_lease(self, fake_vCenter, fake_deploy_from_ova, fake_ovf_cache, fake_PLACEMENT, fake_abort_lease, fake_ImportVApp):
+        """``create_datadomain`` aborts the deploy lease when cancelled while waiting on it"""
+        fake_logger = MagicMock()
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
+        fake_PLACEMENT.choose.return_value = Slot('ds1', 'host1', 'datastore-1', 'host-1')
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+        fake_lease = fake_ImportVApp.return_value
+
+        def get_lease(vcenter, **kwargs):
+            vcenter.resource_pools['Resources'].ImportVApp('someSpec')
+            raise vmware.SoftTimeLimitExceeded()
+        fake_deploy_from_ova.side_effect = get_lease
+
+        with self.assertRaises(ValueError):
+            vmware.create_datadomain(username='alice',
+                                     machine_name='DataDomainBox',
+                                     image='1.0.0',
+                                     network='someLAN',
+                                     logger=fake_logger)
+
+        fake_abort_lease.assert_called_with(fake_lease, fake_logger)
+
+    def test_placed_vcenter_resource_pool(self):
+        """``_PlacedVCenter`` hands out a resource pool that records the deploy lease"""
+        fake_vcenter = MagicMock()
+        fake_vcenter.resource_pools = {'Resources': vmware.vim.ResourcePool('resgroup-1')}
+        placed = vmware._PlacedVCenter(fake_vcenter, Slot('ds1', 'host1', 'datastore-1', 'host-1'))
+
+        self.assertTrue(isinstance(placed.resource_pools['Resources'], vmware._LeaseRecordingPool))
+        self.assertEqual(placed.resource_pools['Resources']._moId, 'resgroup-1')
+
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, 'add_vmdk')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'ovf_cache')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_snapshot(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_ovf_cache, fake_set_meta, fake_add_vmdk, fake_power, fake_PLACEMENT):
+        """``create_datadomain`` takes a baseline snapshot when asked to"""
+        fake_logger = MagicMock()
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        vmware.create_datadomain(username='alice',
+                                 machine_name='DataDomainBox',
+                                 image='1.0.0',
+                                 network='someLAN',
+                                 logger=fake_logger,
+                                 snapshot=True)
+        _, the_kwargs = fake_deploy_from_ova.return_value.CreateSnapshot_Task.call_args
+
+        self.assertEqual(the_kwargs['name'], vmware.BASELINE_SNAPSHOT)
+
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'vCenter')
+    def test_reset_datadomain(self, fake_vCenter, fake_consume_task, fake_power, fake_get_info):
+        """``reset_datadomain`` reverts the VM to the baseline snapshot"""
+        fake_logger = MagicMock()
+        fake_vm = MagicMock()
+        fake_vm.name = 'DataDomainBox'
+        fake_snap = MagicMock()
+        fake_snap.name = vmware.BASELINE_SNAPSHOT
+        fake_vm.snapshot.rootSnapshotList = [fake_snap]
+        fake_folder = MagicMock()
+        fake_folder.childEntity = [fake_vm]
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+        fake_get_info.return_value = {'meta': {'component': 'DataDomain'}}
+
+        output = vmware.reset_datadomain(username='bob', machine_name='DataDomainBox', logger=fake_logger)
+
+        self.assertTrue(fake_snap.snapshot.RevertToSnapshot_Task.called)
+        self.assertEqual(output, {'DataDomainBox': {'meta': {'component': 'DataDomain'}}})
+
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'vCenter')
+    def test_reset_datadomain_no_snapshot(self, fake_vCenter, fake_get_info):
+        """``reset_datadomain`` raises ValueError if the VM has no baseline snapshot"""
+        fake_logger = MagicMock()
+        fake_vm = MagicMock()
+        fake_vm.name = 'DataDomainBox'
+        fake_vm.snapshot = None
+        fake_folder = MagicMock()
+        fake_folder.childEntity = [fake_vm]
+        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+        fake_get_info.return_value = {'meta': {'component': 'DataDomain'}}
+
+        with self.assertRaises(ValueError):
+            vmware.reset_datadomain(username='bob', machine_name='DataDomainBox', logger=fake_logger)
+
+    def test_find_snapshot(self):
+        """``_find_snapshot`` searches child snapshots"""
+        child = MagicMock()
+        child.name = 'baseline'
+        child.childSnapshotList = []
+        root = MagicMock()
+        root.name = 'other'
+        root.childSnapshotList = [child]
+
+        output = vmware._find_snapshot([root], 'baseline')
+
+        self.assertTrue(output is child.snapshot)
+
+    @patch.object(vmware.ovf_cache, 'get_descriptor')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_no_image(self, fake_vCenter, fake_get_descriptor):
+        """``create_datadomain`` raises ValueError if the image does not exist"""
+        fake_logger = MagicMock()
+        fake_get_descriptor.side_effect = [FileNotFoundError('testing')]
+
+        with self.assertRaises(ValueError):
+            vmware.create_datadomain(username='alice',
+                                     machine_name='DataDomainBox',
+                                     image='1.0.0',
+                                     network='someLAN',
+                                     logger=fake_logger)
+
+    @patch.object(vmware, 'ovf_cache')
+    @patch.object(vmware, 'vCenter')
+    def test_create_datadomain_network_first(self, fake_vCenter, fake_ovf_cache):
+        """``create_datadomain`` checks the network before opening the OVA for upload"""
+        fake_logger = MagicMock()
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+        fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
+
+        with self.assertRaises(ValueError):
+            vmware.create_datadomain(username='alice',
+                                     machine_name='DataDomainBox',
+                                     image='1.0.0',
+                                     network='someOtherLAN',
+                                     logger=fake_logger)
+
+        self.assertFalse(fake_ovf_cache.CachedOva.called)
+
+    def test_placed_vcenter_datastore(self):
+        """``_PlacedVCenter`` hands out the chosen datastore, whatever name is asked for"""
+        fake_vcenter = MagicMock()
+        placed = vmware._PlacedVCenter(fake_vcenter, Slot('ds1', 'host1', 'datastore-1', 'host-1'))
+
+        self.assertEqual(placed.datastores['VM-Storage'], vmware.vim.Datastore('datastore-1'))
+
+    def test_placed_vcenter_host(self):
+        """``_PlacedVCenter`` only offers the chosen host"""
+        fake_vcenter = MagicMock()
+        placed = vmware._PlacedVCenter(fake_vcenter, Slot('ds1', 'host1', 'datastore-1', 'host-1'))
+
+        self.assertEqual(list(placed.host_systems.keys()), ['host1'])
+
+    def test_placed_vcenter_passthrough(self):
+        """``_PlacedVCenter`` passes everything else through to the real vCenter"""
+        fake_vcenter = MagicMock()
+        placed = vmware._PlacedVCenter(fake_vcenter, Slot('ds1', 'host1', 'datastore-1', 'host-1'))
+
+        self.assertTrue(placed.ovf_manager is fake_vcenter.ovf_manager)
+
+    @patch.object(vmware, 'ovf_cache')
     @patch.object(vmware.virtual_machine, 'get_info')
     @patch.object(vmware.virtual_machine, 'deploy_from_ova')
     @patch.object(vmware, 'consume_task')
     @patch.object(vmware, 'vCenter')
-    def test_create_datadomain_invalid_network(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_Ova):
+    def test_create_datadomain_invalid_network(self, fake_vCenter, fake_consume_task, fake_deploy_from_ova, fake_get_info, fake_ovf_cache):
         """``create_datadomain`` raises ValueError if supplied with a non-existing network"""
         fake_logger = MagicMock()
         fake_get_info.return_value = {'worked': True}
-        fake_Ova.return_value.networks = ['someLAN']
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
         fake_vCenter.return_value.__enter__.return_value.networks = {'someLAN' : vmware.vim.Network(moId='1')}
 
         with self.assertRaises(ValueError):
@@ -134,6 +526,22 @@ class TestVMware(unittest.TestCase):
         # set() avoids ordering issue in test
         self.assertEqual(set(output), set(expected))
 
+    @patch.object(vmware.os, 'access')
+    @patch.object(vmware.os.path, 'isdir')
+    def test_images_available(self, fake_isdir, fake_access):
+        """``images_available`` - Returns True when the images directory can be read"""
+        fake_isdir.return_value = True
+        fake_access.return_value = True
+
+        self.assertTrue(vmware.images_available())
+
+    @patch.object(vmware.os.path, 'isdir')
+    def test_images_available_missing(self, fake_isdir):
+        """``images_available`` - Returns False when the images directory does not exist"""
+        fake_isdir.return_value = False
+
+        self.assertFalse(vmware.images_available())
+
     def test_convert_name(self):
         """``convert_name`` - defaults to converting to the OVA file name"""
         output = vmware.convert_name(name='7.2.0.50')
@@ -148,6 +556,322 @@ class TestVMware(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(vmware.inventory, 'list_datadomains')
+    @patch.object(vmware, 'vCenter')
+    def test_inventory_datadomain(self, fake_vCenter, fake_list_datadomains):
+        """``inventory_datadomain`` returns one page of DataDomains, and the total"""
+        fake_list_datadomains.return_value = [{'name': 'dd{}'.format(x)} for x in range(5)]
+
+        output = vmware.inventory_datadomain(offset=1, limit=2)
+        expected = {'total': 5, 'offset': 1, 'limit': 2, 'vms': [{'name': 'dd1'}, {'name': 'dd2'}]}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(vmware, 'vCenter')
+    def test_inventory_datadomain_no_folder(self, fake_vCenter):
+        """``inventory_datadomain`` raises ValueError when the top level folder does not exist"""
+        fake_vCenter.return_value.__enter__.return_value.get_vm_folder.side_effect = [FileNotFoundError('testing')]
+
+        with self.assertRaises(ValueError):
+            vmware.inventory_datadomain()
+
+    @patch.object(vmware, '_wait_for_tasks')
+    @patch.object(vmware.inventory, 'find_datadomains')
+    @patch.object(vmware, 'vCenter')
+    def test_power_datadomains(self, fake_vCenter, fake_find_datadomains, fake_wait_for_tasks):
+        """``power_datadomains`` starts every power operation before waiting on any"""
+        dd1, dd2 = MagicMock(), MagicMock()
+        fake_find_datadomains.return_value = {'dd1': (dd1, 'poweredOff'), 'dd2': (dd2, 'poweredOff')}
+        fake_wait_for_tasks.return_value = {'dd1': {'ok': True}, 'dd2': {'ok': True}}
+
+        output = vmware.power_datadomains('alice', ['dd1', 'dd2'], 'on', MagicMock())
+        started = fake_wait_for_tasks.call_args[0][1]
+
+        self.assertTrue(dd1.PowerOn.called)
+        self.assertTrue(dd2.PowerOn.called)
+        self.assertEqual(set(started.keys()), {'dd1', 'dd2'})
+        self.assertEqual(output, {'dd1': {'ok': True}, 'dd2': {'ok': True}})
+
+    @patch.object(vmware, '_wait_for_tasks')
+    @patch.object(vmware.inventory, 'find_datadomains')
+    @patch.object(vmware, 'vCenter')
+    def test_power_datadomains_unreachable(self, fake_vCenter, fake_find_datadomains, fake_wait_for_tasks):
+        """``power_datadomains`` keeps the VMs it already started when vCenter drops part way through"""
+        dd1, dd2 = MagicMock(), MagicMock()
+        dd2.PowerOn.side_effect = [ConnectionResetError('testing')]
+        fake_find_datadomains.return_value = {'dd1': (dd1, 'poweredOff'), 'dd2': (dd2, 'poweredOff')}
+        fake_wait_for_tasks.return_value = {'dd1': {'ok': True, 'seconds': 1.0, 'error': None}}
+
+        output = vmware.power_datadomains('alice', ['dd1', 'dd2'], 'on', MagicMock())
+        started = fake_wait_for_tasks.call_args[0][1]
+
+        self.assertEqual(list(started.keys()), ['dd1'])
+        self.assertTrue(output['dd1']['ok'])
+        self.assertFalse(output['dd2']['ok'])
+
+    @patch.object(vmware, '_wait_for_tasks')
+    @patch.object(vmware.inventory, 'find_datadomains')
+    @patch.object(vmware, 'vCenter')
+    def test_power_datadomains_skips(self, fake_vCenter, fake_find_datadomains, fake_wait_for_tasks):
+        """``power_datadomains`` reports VMs that are missing, or already in the requested state"""
+        dd1 = MagicMock()
+        fake_find_datadomains.return_value = {'dd1': (dd1, 'poweredOff')}
+        fake_wait_for_tasks.return_value = {}
+
+        output = vmware.power_datadomains('alice', ['dd1', 'dd2'], 'off', MagicMock())
+
+        self.assertFalse(dd1.PowerOff.called)
+        self.assertTrue(output['dd1']['ok'])
+        self.assertFalse(output['dd2']['ok'])
+
+    @patch.object(vmware.time, 'sleep')
+    def test_wait_for_tasks(self, fake_sleep):
+        """``_wait_for_tasks`` checks every pending task in a single call, until they all complete"""
+        task1 = vmware.vim.Task('task-1')
+        task2 = vmware.vim.Task('task-2')
+        error = MagicMock()
+        error.msg = 'testing'
+        fake_vcenter = MagicMock()
+        fake_vcenter.content.propertyCollector.RetrieveContents.side_effect = [
+            [make_task_content(task1, 'success'), make_task_content(task2, 'running')],
+            [make_task_content(task2, 'error', error)],
+        ]
+
+        output = vmware._wait_for_tasks(fake_vcenter, {'dd1': (task1, 0), 'dd2': (task2, 0)})
+
+        self.assertEqual(fake_vcenter.content.propertyCollector.RetrieveContents.call_count, 2)
+        self.assertTrue(output['dd1']['ok'])
+        self.assertEqual(output['dd2']['error'], 'testing')
+
+    @patch.object(vmware.time, 'sleep')
+    def test_wait_for_tasks_timeout(self, fake_sleep):
+        """``_wait_for_tasks`` gives up on tasks that take longer than the timeout"""
+        task1 = vmware.vim.Task('task-1')
+        fake_vcenter = MagicMock()
+        fake_vcenter.content.propertyCollector.RetrieveContents.return_value = [make_task_content(task1, 'running')]
+
+        output = vmware._wait_for_tasks(fake_vcenter, {'dd1': (task1, 0)}, timeout=-1)
+
+        self.assertFalse(output['dd1']['ok'])
+
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, '_find_datadomain')
+    @patch.object(vmware, 'vCenter')
+    def test_begin_delete(self, fake_vCenter, fake_find_datadomain, fake_set_meta):
+        """``begin_delete`` marks the VM as deleting, and powers it off without waiting"""
+        the_vm = fake_find_datadomain.return_value
+        the_vm._moId = 'vm-1'
+        the_vm.config.annotation = '{"component": "DataDomain"}'
+        the_vm.runtime.powerState = 'poweredOn'
+        the_vm.PowerOff.return_value._moId = 'task-1'
+
+        output = vmware.begin_delete('alice', 'myDataDomain', MagicMock())
+        expected = {'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}
+
+        self.assertEqual(output, expected)
+        self.assertTrue(fake_set_meta.call_args[0][1]['deleting'])
+
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, '_find_datadomain')
+    @patch.object(vmware, 'vCenter')
+    def test_begin_delete_powered_off(self, fake_vCenter, fake_find_datadomain, fake_set_meta):
+        """``begin_delete`` goes straight to destroying a VM that is already off"""
+        the_vm = fake_find_datadomain.return_value
+        the_vm.config.annotation = '{"component": "DataDomain"}'
+        the_vm.runtime.powerState = 'poweredOff'
+
+        output = vmware.begin_delete('alice', 'myDataDomain', MagicMock())
+
+        self.assertEqual(output['stage'], 'destroy')
+        self.assertFalse(the_vm.PowerOff.called)
+
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, '_find_datadomain')
+    @patch.object(vmware, 'vCenter')
+    def test_begin_delete_not_started(self, fake_vCenter, fake_find_datadomain, fake_set_meta):
+        """``begin_delete`` clears the deleting flag if vCenter refuses to power off the VM"""
+        the_vm = fake_find_datadomain.return_value
+        the_vm.config.annotation = '{"component": "DataDomain"}'
+        the_vm.runtime.powerState = 'poweredOn'
+        the_vm.PowerOff.side_effect = [vmware.vim.fault.InvalidState()]
+
+        with self.assertRaises(vmware.vim.fault.InvalidState):
+            vmware.begin_delete('alice', 'myDataDomain', MagicMock())
+        flags = [x[0][1].get('deleting') for x in fake_set_meta.call_args_list]
+
+        self.assertEqual(flags, [True, None])
+
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, '_find_datadomain')
+    @patch.object(vmware, 'vCenter')
+    def test_begin_delete_flag_first(self, fake_vCenter, fake_find_datadomain, fake_set_meta):
+        """``begin_delete`` sets the deleting flag before powering off the VM"""
+        the_vm = fake_find_datadomain.return_value
+        the_vm.config.annotation = '{"component": "DataDomain"}'
+        the_vm.runtime.powerState = 'poweredOn'
+        fake_set_meta.side_effect = lambda *args: self.assertFalse(the_vm.PowerOff.called)
+
+        vmware.begin_delete('alice', 'myDataDomain', MagicMock())
+
+        self.assertTrue(fake_set_meta.called)
+
+    @patch.object(vmware.virtual_machine, 'consume_task')
+    @patch.object(vmware, '_find_datadomain')
+    @patch.object(vmware, 'vCenter')
+    def test_begin_delete_flag_error(self, fake_vCenter, fake_find_datadomain, fake_consume_task):
+        """``begin_delete`` still starts the delete if vCenter fails to set the deleting flag"""
+        the_vm = fake_find_datadomain.return_value
+        the_vm.config.annotation = '{"component": "DataDomain", "created": 1234, "version": "1.0", "generation": 1, "configured": false}'
+        the_vm.runtime.powerState = 'poweredOff'
+        fake_consume_task.side_effect = [RuntimeError('testing')]
+
+        output = vmware.begin_delete('alice', 'myDataDomain', MagicMock())
+
+        self.assertEqual(output['stage'], 'destroy')
+        self.assertTrue(the_vm.Destroy_Task.called)
+
+    def test_mark_deleting_bad_meta(self):
+        """``_mark_deleting`` logs, rather than raises, when the VM's meta data is incomplete"""
+        fake_logger = MagicMock()
+        the_vm = MagicMock()
+        the_vm.config.annotation = '{"component": "DataDomain"}'
+
+        vmware._mark_deleting(the_vm, True, fake_logger)
+
+        self.assertTrue(fake_logger.error.called)
+
+    @patch.object(vmware.vim, 'Task')
+    @patch.object(vmware, 'vCenter')
+    def test_check_delete_running(self, fake_vCenter, fake_Task):
+        """``check_delete`` returns the same progress while vCenter is still working"""
+        fake_Task.return_value.info.state = 'running'
+        progress = {'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}
+
+        output = vmware.check_delete(progress, MagicMock())
+
+        self.assertEqual(output, progress)
+
+    @patch.object(vmware.vim, 'VirtualMachine')
+    @patch.object(vmware.vim, 'Task')
+    @patch.object(vmware, 'vCenter')
+    def test_check_delete_powered_off(self, fake_vCenter, fake_Task, fake_VirtualMachine):
+        """``check_delete`` issues the destroy once the VM has powered off"""
+        fake_Task.return_value.info.state = 'success'
+        fake_VirtualMachine.return_value.Destroy_Task.return_value._moId = 'task-2'
+
+        output = vmware.check_delete({'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}, MagicMock())
+        expected = {'vm': 'vm-1', 'task': 'task-2', 'stage': 'destroy'}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(vmware.vim, 'Task')
+    @patch.object(vmware, 'vCenter')
+    def test_check_delete_done(self, fake_vCenter, fake_Task):
+        """``check_delete`` reports done once the VM is destroyed"""
+        fake_Task.return_value.info.state = 'success'
+
+        output = vmware.check_delete({'vm': 'vm-1', 'task': 'task-2', 'stage': 'destroy'}, MagicMock())
+
+        self.assertEqual(output['stage'], 'done')
+
+    @patch.object(vmware.vim, 'Task')
+    @patch.object(vmware, 'vCenter')
+    def test_check_delete_error(self, fake_vCenter, fake_Task):
+        """``check_delete`` raises ValueError when vCenter fails to destroy the VM"""
+        fake_Task.return_value.info.state = 'error'
+
+        with self.assertRaises(ValueError):
+            vmware.check_delete({'vm': 'vm-1', 'task': 'task-2', 'stage': 'destroy'}, MagicMock())
+
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware.vim, 'VirtualMachine')
+    @patch.object(vmware.vim, 'Task')
+    @patch.object(vmware, 'vCenter')
+    def test_check_delete_error_clears_flag(self, fake_vCenter, fake_Task, fake_VirtualMachine, fake_set_meta):
+        """``check_delete`` clears the deleting flag when vCenter fails to delete the VM"""
+        fake_Task.return_value.info.state = 'error'
+        fake_VirtualMachine.return_value.config.annotation = '{"component": "DataDomain", "deleting": true}'
+
+        with self.assertRaises(ValueError):
+            vmware.check_delete({'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}, MagicMock())
+        meta = fake_set_meta.call_args[0][1]
+
+        self.assertFalse('deleting' in meta)
+
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware.vim, 'VirtualMachine')
+    @patch.object(vmware.vim, 'Task')
+    @patch.object(vmware, 'vCenter')
+    def test_check_delete_destroy_refused(self, fake_vCenter, fake_Task, fake_VirtualMachine, fake_set_meta):
+        """``check_delete`` raises ValueError and clears the deleting flag when vCenter refuses the destroy"""
+        fake_Task.return_value.info.state = 'success'
+        fake_VirtualMachine.return_value.config.annotation = '{"component": "DataDomain", "deleting": true}'
+        fake_VirtualMachine.return_value.Destroy_Task.side_effect = [vmware.vim.fault.InvalidState()]
+
+        with self.assertRaises(ValueError):
+            vmware.check_delete({'vm': 'vm-1', 'task': 'task-1', 'stage': 'power'}, MagicMock())
+
+        self.assertTrue(fake_set_meta.called)
+
+    def _preflight_vcenter(self):
+        fake_vcenter = MagicMock()
+        fake_vcenter.networks = {'someLAN': vmware.vim.Network(moId='1')}
+        existing = MagicMock()
+        existing.name = 'existingBox'
+        fake_vcenter.get_by_name.return_value.childEntity = [existing]
+        return fake_vcenter
+
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware, 'ovf_cache')
+    def test_preflight(self, fake_ovf_cache, fake_PLACEMENT):
+        """``preflight`` returns the OVA path, descriptor and network when every check passes"""
+        fake_ovf_cache.deployed_size.return_value = 1024
+        fake_PLACEMENT.max_free.return_value = 2048
+        fake_ovf_cache.get_descriptor.return_value = {'networks': ['someLAN']}
+
+        _, descriptor, network = vmware.preflight(self._preflight_vcenter(), 'alice', 'newBox', '1.0.0', 'someLAN')
+
+        self.assertEqual(descriptor, {'networks': ['someLAN']})
+        self.assertEqual(network, vmware.vim.Network(moId='1'))
+
+    @patch.object(vmware, 'ovf_cache')
+    def test_preflight_bad_name(self, fake_ovf_cache):
+        """``preflight`` raises ValueError for a machine name that is not a valid hostname"""
+        with self.assertRaises(ValueError):
+            vmware.preflight(self._preflight_vcenter(), 'alice', 'new_Box', '1.0.0', 'someLAN')
+
+        self.assertFalse(fake_ovf_cache.get_descriptor.called)
+
+    @patch.object(vmware, 'ovf_cache')
+    def test_preflight_no_image(self, fake_ovf_cache):
+        """``preflight`` raises ValueError when the image does not exist"""
+        fake_ovf_cache.get_descriptor.side_effect = [FileNotFoundError('testing')]
+
+        with self.assertRaises(ValueError):
+            vmware.preflight(self._preflight_vcenter(), 'alice', 'newBox', '1.0.0', 'someLAN')
+
+    @patch.object(vmware, 'ovf_cache')
+    def test_preflight_no_network(self, fake_ovf_cache):
+        """``preflight`` raises ValueError when the network does not exist"""
+        with self.assertRaises(ValueError):
+            vmware.preflight(self._preflight_vcenter(), 'alice', 'newBox', '1.0.0', 'otherLAN')
+
+    @patch.object(vmware, 'ovf_cache')
+    def test_preflight_duplicate_name(self, fake_ovf_cache):
+        """``preflight`` raises ValueError when the user already has a machine by that name"""
+        with self.assertRaises(ValueError):
+            vmware.preflight(self._preflight_vcenter(), 'alice', 'existingBox', '1.0.0', 'someLAN')
+
+    @patch.object(vmware, 'PLACEMENT')
+    @patch.object(vmware, 'ovf_cache')
+    def test_preflight_no_space(self, fake_ovf_cache, fake_PLACEMENT):
+        """``preflight`` raises ValueError when no datastore can hold the image"""
+        fake_ovf_cache.deployed_size.return_value = 2048
+        fake_PLACEMENT.max_free.return_value = 1024
+
+        with self.assertRaises(ValueError):
+            vmware.preflight(self._preflight_vcenter(), 'alice', 'newBox', '1.0.0', 'someLAN')
+
 
 if __name__ == '__main__':
     unittest.main()
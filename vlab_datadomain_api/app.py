@@ -3,12 +3,17 @@ from flask import Flask
 from celery import Celery
 
 from vlab_datadomain_api.lib import const
+from vlab_datadomain_api.lib.prober import HealthProber
 from vlab_datadomain_api.lib.views import HealthView, DataDomainView
 
 app = Flask(__name__)
+# rpc:// replies to the sending thread only; see server.py before adding API threads
 app.celery_app = Celery('datadomain', backend='rpc://', broker=const.VLAB_MESSAGE_BROKER)
 app.celery_app.conf.broker_heartbeat = 0 #https://github.com/celery/celery/issues/4895
 
+app.health_prober = HealthProber()
+app.health_prober.start()
+
 HealthView.register(app)
 DataDomainView.register(app)
 
@@ -16,7 +16,7 @@ DEFINED = OrderedDict([
             ('INF_VCENTER_PORT', int(environ.get('INFO_VCENTER_PORT', 443))),
             ('INF_VCENTER_USER', environ.get('INF_VCENTER_USER', 'tester')),
             ('INF_VCENTER_PASSWORD', environ.get('INF_VCENTER_PASSWORD', 'a')),
-            ('INF_VCENTER_DATASTORE', environ.get('INF_VCENTER_DATASTORE', 'VM-Storage')),
+            ('INF_VCENTER_DATASTORE', environ.get('INF_VCENTER_DATASTORE', 'VM-Storage').split(',')),
             ('INF_VCENTER_RESORUCE_POOL', environ.get('INF_VCENTER_RESORUCE_POOL', 'Resources')),
             ('INF_VCENTER_TOP_LVL_DIR', environ.get('INF_VCENTER_TOP_LVL_DIR', 'vlab')),
             ('INF_VCENTER_VERIFY_CERT', environ.get('INF_VCENTER_VERIFY_CERT', False)),
@@ -24,6 +24,25 @@ DEFINED = OrderedDict([
             ('VLAB_URL', environ.get('VLAB_URL', 'https://localhost')),
             ('VLAB_DATADOMAIN_IMAGES_DIR', environ.get('VLAB_DATADOMAIN_IMAGES_DIR', '/images')),
             ('VLAB_VERIFY_TOKEN', environ.get('VLAB_VERIFY_TOKEN', False)),
+            ('VLAB_DATADOMAIN_API_PROCESSES', int(environ.get('VLAB_DATADOMAIN_API_PROCESSES', 1))),
+            ('VLAB_DATADOMAIN_API_THREADS', int(environ.get('VLAB_DATADOMAIN_API_THREADS', 1))),
+            ('VLAB_DATADOMAIN_API_LISTEN', int(environ.get('VLAB_DATADOMAIN_API_LISTEN', 128))),
+            ('VLAB_DATADOMAIN_HEALTH_INTERVAL', int(environ.get('VLAB_DATADOMAIN_HEALTH_INTERVAL', 30))),
+            ('VLAB_DATADOMAIN_HEALTH_TIMEOUT', int(environ.get('VLAB_DATADOMAIN_HEALTH_TIMEOUT', 5))),
+            ('VLAB_DATADOMAIN_PLACEMENT_REFRESH', int(environ.get('VLAB_DATADOMAIN_PLACEMENT_REFRESH', 300))),
+            ('VLAB_DATADOMAIN_PLACEMENT_DIR', environ.get('VLAB_DATADOMAIN_PLACEMENT_DIR', '/tmp/vlab_datadomain_placement')),
+            ('VLAB_DATADOMAIN_VCENTER_RETRIES', int(environ.get('VLAB_DATADOMAIN_VCENTER_RETRIES', 3))),
+            ('VLAB_DATADOMAIN_VCENTER_BACKOFF', float(environ.get('VLAB_DATADOMAIN_VCENTER_BACKOFF', 1))),
+            ('VLAB_DATADOMAIN_BREAKER_THRESHOLD', int(environ.get('VLAB_DATADOMAIN_BREAKER_THRESHOLD', 5))),
+            ('VLAB_DATADOMAIN_BREAKER_RESET', int(environ.get('VLAB_DATADOMAIN_BREAKER_RESET', 60))),
+            ('VLAB_DATADOMAIN_OVF_CACHE_DIR', environ.get('VLAB_DATADOMAIN_OVF_CACHE_DIR', '')),
+            ('VLAB_DATADOMAIN_DEFER_RETRIES', int(environ.get('VLAB_DATADOMAIN_DEFER_RETRIES', 5))),
+            ('VLAB_DATADOMAIN_PROFILE_DIR', environ.get('VLAB_DATADOMAIN_PROFILE_DIR', '/tmp/vlab_datadomain_profiles')),
+            ('VLAB_DATADOMAIN_ADMINS', [x for x in environ.get('VLAB_DATADOMAIN_ADMINS', '').split(',') if x]),
+            ('VLAB_DATADOMAIN_INVENTORY_PAGE', int(environ.get('VLAB_DATADOMAIN_INVENTORY_PAGE', 500))),
+            ('VLAB_DATADOMAIN_POWER_TIMEOUT', int(environ.get('VLAB_DATADOMAIN_POWER_TIMEOUT', 600))),
+            ('VLAB_DATADOMAIN_DELETE_POLL', int(environ.get('VLAB_DATADOMAIN_DELETE_POLL', 5))),
+            ('VLAB_DATADOMAIN_DELETE_TIMEOUT', int(environ.get('VLAB_DATADOMAIN_DELETE_TIMEOUT', 1200))),
           ])
 
 Constants = namedtuple('Constants', list(DEFINED.keys()))
@@ -0,0 +1,45 @@
+# -*- coding: UTF-8 -*-
+"""
+Ties a task to the user who sent it through the task's id, so any API process
+can tell who owns a task without asking the workers, or keeping any state.
+
+A task id is a random UUID followed by a digest of that UUID and the owner's
+username. Knowing someone else's task id doesn't help; the digest won't match
+a different username.
+"""
+import uuid
+import hashlib
+
+# How many hex characters of the digest to keep
+DIGEST_LENGTH = 16
+
+
+def new_task_id(username):
+    """Make the id for a task being sent on behalf of a user
+
+    :Returns: String
+
+    :param username: The user the task is being sent for
+    :type username: String
+    """
+    nonce = str(uuid.uuid4())
+    return '{}-{}'.format(nonce, _digest(nonce, username))
+
+
+def owned_by(task_id, username):
+    """Check if a task was sent on behalf of the user
+
+    :Returns: Boolean
+
+    :param task_id: The id of the task
+    :type task_id: String
+
+    :param username: The user to check
+    :type username: String
+    """
+    nonce, _, digest = task_id.rpartition('-')
+    return bool(nonce) and digest == _digest(nonce, username)
+
+
+def _digest(nonce, username):
+    return hashlib.sha256('{}:{}'.format(nonce, username).encode()).hexdigest()[:DIGEST_LENGTH]
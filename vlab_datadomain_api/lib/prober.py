@@ -0,0 +1,171 @@
+# -*- coding: UTF-8 -*-
+"""
+Periodically checks the services the API depends upon, so the healthcheck end
+point can report on them without doing any blocking I/O itself.
+"""
+import time
+import threading
+
+import ujson
+from celery import Celery
+from vlab_api_common import get_logger
+
+from vlab_datadomain_api.lib import const
+
+logger = get_logger(__name__, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL)
+
+
+class HealthProber(object):
+    """Runs the dependency checks in a background thread, caching the results.
+
+    The API is only considered unhealthy when the broker is unreachable, no
+    workers answer a ping, or a worker reports the images directory is missing.
+    Queue depth and latency are reported, but a busy queue is not a failure.
+
+    :param celery_app: The Celery app to probe with. Defaults to a dedicated app
+                       so the probes never share a reply queue with API requests.
+    :type celery_app: celery.Celery
+
+    :param interval: How many seconds to wait between probes
+    :type interval: Integer
+
+    :param timeout: How many seconds to wait on any single check
+    :type timeout: Integer
+    """
+    def __init__(self, celery_app=None, interval=const.VLAB_DATADOMAIN_HEALTH_INTERVAL,
+                 timeout=const.VLAB_DATADOMAIN_HEALTH_TIMEOUT):
+        if celery_app is None:
+            celery_app = Celery('datadomain', backend='rpc://', broker=const.VLAB_MESSAGE_BROKER)
+            celery_app.conf.broker_heartbeat = 0
+        self._celery_app = celery_app
+        self.interval = interval
+        self.timeout = timeout
+        self._stop = threading.Event()
+        self._thread = None
+        self.status = {'healthy': None, 'checked': None, 'checks': {}}
+        # The image versions a worker last reported, or None until one has
+        self.images = None
+
+    def start(self):
+        """Begin probing in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='health-prober', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop probing"""
+        self._stop.set()
+
+    @property
+    def stale(self):
+        """True when the cached results are too old to be trusted, i.e. the thread died
+
+        :Returns: Boolean
+        """
+        checked = self.status['checked']
+        if checked is None:
+            return False
+        return time.time() - checked > self.interval * 3 + self.timeout * 4
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.probe()
+            except Exception as doh:
+                logger.exception(doh)
+            self._stop.wait(self.interval)
+
+    def probe(self):
+        """Run every check once, and replace the cached status
+
+        :Returns: Dictionary
+        """
+        checks = {}
+        checks['broker'] = self._check_broker()
+        if checks['broker']['ok']:
+            checks['workers'] = self._check_workers()
+            checks['queue'], worker_health = self._check_queue()
+            checks['images_dir'] = {'ok': worker_health.get('images_dir', None)}
+            if worker_health.get('images') is not None:
+                self.images = frozenset(worker_health['images'])
+        else:
+            checks['workers'] = {'ok': False, 'count': 0}
+            checks['queue'] = {'ok': None, 'depth': None, 'latency': None}
+            checks['images_dir'] = {'ok': None}
+        healthy = all(checks[x]['ok'] is not False for x in checks)
+        # Swap in a whole new dict so readers never see a half updated status
+        self.status = {'healthy': healthy, 'checked': time.time(), 'checks': checks}
+        return self.status
+
+    def _check_broker(self):
+        """Can we connect to the message broker?"""
+        start = time.time()
+        try:
+            with self._celery_app.connection_for_write() as conn:
+                conn.ensure_connection(max_retries=1, timeout=self.timeout)
+        except Exception as doh:
+            logger.error('Health probe: broker unreachable: {}'.format(doh))
+            return {'ok': False, 'latency': None}
+        return {'ok': True, 'latency': time.time() - start}
+
+    def _check_workers(self):
+        """Do any workers answer a ping?"""
+        try:
+            replies = self._celery_app.control.ping(timeout=self.timeout)
+        except Exception as doh:
+            logger.error('Health probe: worker ping failed: {}'.format(doh))
+            replies = []
+        return {'ok': len(replies) > 0, 'count': len(replies)}
+
+    def _check_queue(self):
+        """How many tasks are waiting, and how long does a trivial task take to run?
+
+        :Returns: Tuple (Dictionary, Dictionary of what the worker reported)
+        """
+        depth = None
+        try:
+            with self._celery_app.connection_for_write() as conn:
+                queue = self._celery_app.conf.task_default_queue
+                depth = conn.default_channel.queue_declare(queue=queue, passive=True).message_count
+        except Exception as doh:
+            logger.error('Health probe: unable to read queue depth: {}'.format(doh))
+        start = time.time()
+        try:
+            # expires keeps unanswered probes from piling up behind long running tasks
+            result = self._celery_app.send_task('datadomain.health', ['healthcheck'], expires=self.timeout)
+            answer = result.get(timeout=self.timeout)
+        except Exception:
+            # Workers can be busy with long deploys; that's slow, not broken
+            logger.info('Health probe: no answer from workers within {} seconds'.format(self.timeout))
+            return {'ok': None, 'depth': depth, 'latency': None}, {}
+        return {'ok': True, 'depth': depth, 'latency': time.time() - start}, answer['content']
+
+    def has_image(self, image):
+        """Check an image against the index the workers last reported. Answers
+        True when no worker has reported yet, so creates are never blocked on
+        a cold start; the worker checks again before deploying anything.
+
+        :Returns: Boolean
+
+        :param image: The image/version of DataDomain to create
+        :type image: String
+        """
+        images = self.images
+        return images is None or image in images
+
+    def serialize(self, extra):
+        """Build the JSON body and HTTP status code for the healthcheck
+
+        :Returns: Tuple (String, Integer)
+
+        :param extra: Additional, static, info to include in the body
+        :type extra: Dictionary
+        """
+        body = dict(extra)
+        status = self.status
+        body.update(status)
+        if self.stale:
+            body['healthy'] = False
+            body['error'] = 'Health probe results are stale'
+        code = 503 if body['healthy'] is False else 200
+        return ujson.dumps(body), code
@@ -6,16 +6,30 @@ import ujson
 from flask import current_app
 from flask_classy import request, route, Response
 from vlab_inf_common.views import MachineView
-from vlab_inf_common.vmware import vCenter, vim
 from vlab_api_common import describe, get_logger, requires, validate_input
 
 
-from vlab_datadomain_api.lib import const
+from vlab_datadomain_api.lib import const, ownership
 
 
 logger = get_logger(__name__, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL)
 
 
+def _profile_kwargs():
+    """Tasks are only profiled when the client sets the X-PROFILE header; the
+    profile is saved under the X-REQUEST-ID, so that must be set too.
+
+    :Returns: Dictionary
+
+    :Raises: ValueError if X-PROFILE is set without X-REQUEST-ID
+    """
+    if request.headers.get('X-PROFILE', '').lower() in ('1', 'true', 'yes'):
+        if not request.headers.get('X-REQUEST-ID'):
+            raise ValueError('Header X-REQUEST-ID is required with X-PROFILE')
+        return {'profile': True}
+    return {}
+
+
 class DataDomainView(MachineView):
     """API end point for Data Domain"""
     route_base = '/api/2/inf/data-domain'
@@ -35,6 +49,11 @@ class DataDomainView(MachineView):
                         "network": {
                             "description": "The network to hook the Data Domain server up to",
                             "type": "string"
+                        },
+                        "snapshot": {
+                            "description": "Take a baseline snapshot, so the Data Domain server can be quickly reset",
+                            "type": "boolean",
+                            "default": False
                         }
                     },
                     "required": ["name", "image", "network"]
@@ -46,13 +65,51 @@ class DataDomainView(MachineView):
                         "name": {
                             "description": "The name of the Data Domain server to destroy",
                             "type": "string"
+                        },
+                        "wait": {
+                            "description": "Set to false to have the task return once the destroy has started; its content holds the id of a task that tracks the destroy to completion",
+                            "type": "boolean",
+                            "default": True
                         }
                      },
                      "required": ["name"]
                     }
+    RESET_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                    "description": "Revert a Data Domain server to the baseline snapshot taken when it was created",
+                    "type": "object",
+                    "properties": {
+                       "name": {
+                           "description": "The name of the Data Domain server to reset",
+                           "type": "string"
+                       }
+                    },
+                    "required": ["name"]
+                   }
+    POWER_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                    "description": "Power on/off/restart many Data Domain servers at once",
+                    "type": "object",
+                    "properties": {
+                       "names": {
+                           "description": "The names of the Data Domain servers",
+                           "type": "array",
+                           "items": {"type": "string"},
+                           "minItems": 1,
+                           "uniqueItems": True
+                       },
+                       "power": {
+                           "description": "The power state to put the Data Domain servers into",
+                           "type": "string",
+                           "enum": ["on", "off", "restart"]
+                       }
+                    },
+                    "required": ["names", "power"]
+                   }
     GET_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
                   "description": "Display the Data Domain servers you own"
                  }
+    INVENTORY_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                        "description": "Display every user's Data Domain servers. Admins only. Supports the query parameters offset, limit, version and state (poweredOn, poweredOff or suspended)."
+                       }
     IMAGES_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
                      "description": "View available versions of Data Domain that can be created"
                     }
@@ -65,7 +122,12 @@ class DataDomainView(MachineView):
         username = kwargs['token']['username']
         resp_data = {'user' : username}
         txn_id = request.headers.get('X-REQUEST-ID', 'noId')
-        task = current_app.celery_app.send_task('datadomain.show', [username, txn_id])
+        try:
+            profile_kwargs = _profile_kwargs()
+        except ValueError as doh:
+            resp_data['error'] = '{}'.format(doh)
+            return ujson.dumps(resp_data), 400
+        task = current_app.celery_app.send_task('datadomain.show', [username, txn_id], kwargs=profile_kwargs, task_id=ownership.new_task_id(username))
         resp_data['content'] = {'task-id': task.id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
@@ -83,7 +145,17 @@ class DataDomainView(MachineView):
         machine_name = body['name']
         image = body['image']
         network = '{}_{}'.format(username, body['network'])
-        task = current_app.celery_app.send_task('datadomain.create', [username, machine_name, image, network, txn_id])
+        snapshot = body.get('snapshot', False)
+        try:
+            profile_kwargs = _profile_kwargs()
+        except ValueError as doh:
+            resp_data['error'] = '{}'.format(doh)
+            return ujson.dumps(resp_data), 400
+        prober = getattr(current_app, 'health_prober', None)
+        if prober is not None and not prober.has_image(image):
+            resp_data['error'] = 'No such image {}'.format(image)
+            return ujson.dumps(resp_data), 400
+        task = current_app.celery_app.send_task('datadomain.create', [username, machine_name, image, network, txn_id, snapshot], kwargs=profile_kwargs, task_id=ownership.new_task_id(username))
         resp_data['content'] = {'task-id': task.id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
@@ -98,7 +170,109 @@ class DataDomainView(MachineView):
         txn_id = request.headers.get('X-REQUEST-ID', 'noId')
         resp_data = {'user' : username}
         machine_name = kwargs['body']['name']
-        task = current_app.celery_app.send_task('datadomain.delete', [username, machine_name, txn_id])
+        wait = kwargs['body'].get('wait', True)
+        try:
+            profile_kwargs = _profile_kwargs()
+        except ValueError as doh:
+            resp_data['error'] = '{}'.format(doh)
+            return ujson.dumps(resp_data), 400
+        task = current_app.celery_app.send_task('datadomain.delete', [username, machine_name, txn_id, wait], kwargs=profile_kwargs, task_id=ownership.new_task_id(username))
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+    @route('/reset', methods=["POST"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @validate_input(schema=RESET_SCHEMA)
+    def reset(self, *args, **kwargs):
+        """Revert a Data Domain server to the state it was created in"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        machine_name = kwargs['body']['name']
+        task = current_app.celery_app.send_task('datadomain.reset', [username, machine_name, txn_id], task_id=ownership.new_task_id(username))
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+    @route('/power', methods=["POST"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @validate_input(schema=POWER_SCHEMA)
+    def power(self, *args, **kwargs):
+        """Power on/off/restart many Data Domain servers at once"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        body = kwargs['body']
+        task = current_app.celery_app.send_task('datadomain.power', [username, body['names'], body['power'], txn_id], task_id=ownership.new_task_id(username))
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+    @route('/task/<tid>', methods=["DELETE"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    def cancel(self, *args, **kwargs):
+        """Stop a task. A create that's in-flight aborts the OVA upload and destroys the partial VM"""
+        username = kwargs['token']['username']
+        resp_data = {'user' : username}
+        task_id = kwargs['tid']
+        if not ownership.owned_by(task_id, username):
+            resp_data['error'] = 'user {} does not own task {}'.format(username, task_id)
+            return ujson.dumps(resp_data), 403
+        # SIGUSR1 raises SoftTimeLimitExceeded within a running task, letting it
+        # clean up. Tasks that have not started yet are simply dropped.
+        current_app.celery_app.control.revoke(task_id, terminate=True, signal='SIGUSR1')
+        resp_data['content'] = {'task-id': task_id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task_id))
+        return resp
+
+    @route('/profile/<request_id>', methods=["GET"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    def profile(self, *args, **kwargs):
+        """Obtain the profile of one of your requests that was sent with the X-PROFILE header"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        task = current_app.celery_app.send_task('datadomain.profile', [username, kwargs['request_id'], txn_id], task_id=ownership.new_task_id(username))
+        resp_data['content'] = {'task-id': task.id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        return resp
+
+    @route('/inventory', methods=["GET"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @describe(get=INVENTORY_SCHEMA)
+    def inventory(self, *args, **kwargs):
+        """Display every user's Data Domain servers"""
+        username = kwargs['token']['username']
+        if username not in const.VLAB_DATADOMAIN_ADMINS:
+            return ujson.dumps({'error' : 'user {} does not have access'.format(username)}), 403
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', const.VLAB_DATADOMAIN_INVENTORY_PAGE))
+        except ValueError:
+            resp_data['error'] = 'Params offset and limit must be integers'
+            return ujson.dumps(resp_data), 400
+        if offset < 0 or not 0 < limit <= const.VLAB_DATADOMAIN_INVENTORY_PAGE:
+            resp_data['error'] = 'Param offset must be 0 or more, and limit between 1 and {}'.format(const.VLAB_DATADOMAIN_INVENTORY_PAGE)
+            return ujson.dumps(resp_data), 400
+        state = request.args.get('state', None)
+        if state not in (None, 'poweredOn', 'poweredOff', 'suspended'):
+            resp_data['error'] = 'Param state must be one of poweredOn, poweredOff or suspended'
+            return ujson.dumps(resp_data), 400
+        version = request.args.get('version', None)
+        task = current_app.celery_app.send_task('datadomain.inventory', [version, state, offset, limit, txn_id])
         resp_data['content'] = {'task-id': task.id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
@@ -2,15 +2,24 @@
 """
 Enables Health checks for the power API
 """
-from time import time
-import pkg_resources
+try:
+    from importlib.metadata import version
+except ImportError:
+    # Python < 3.8; pkg_resources is slow to import, so only use it as a fallback
+    import pkg_resources
+    def version(dist_name):
+        return pkg_resources.get_distribution(dist_name).version
 
 import ujson
+from flask import current_app
 from flask_classy import FlaskView, Response
-from vlab_inf_common.vmware import vCenter
 
 from vlab_datadomain_api.lib import const
 
+VERSION = version('vlab-datadomain-api')
+# Used when there's no background prober; nothing in it changes, so build it once.
+HEALTH_BODY = ujson.dumps({'version': VERSION})
+
 
 class HealthView(FlaskView):
     """
@@ -20,11 +29,17 @@ class HealthView(FlaskView):
     trailing_slash = False
 
     def get(self):
-        """End point for health checks"""
-        resp = {}
-        status = 200
-        resp['version'] = pkg_resources.get_distribution('vlab-datadomain-api').version
-        response = Response(ujson.dumps(resp))
+        """End point for health checks
+
+        Only reads the results cached by the app's ``health_prober``; it never
+        talks to the broker or workers itself.
+        """
+        prober = getattr(current_app, 'health_prober', None)
+        if prober is None:
+            body, status = HEALTH_BODY, 200
+        else:
+            body, status = prober.serialize({'version': VERSION})
+        response = Response(body)
         response.status_code = status
         response.headers['Content-Type'] = 'application/json'
         return response
@@ -0,0 +1,224 @@
+# -*- coding: UTF-8 -*-
+"""
+Caches what's parsed out of an OVA file, so repeat deploys of the same image
+skip scanning the tar and re-reading the OVF.
+
+Descriptors are keyed by the path, size and modification time of the OVA, so
+replacing an image on disk invalidates its entry. They're kept in memory, and
+also on disk when ``VLAB_DATADOMAIN_OVF_CACHE_DIR`` is set, so they outlive
+worker restarts.
+"""
+import os
+import re
+import hashlib
+import tarfile
+import threading
+from xml.etree import ElementTree
+
+import ujson
+from vlab_inf_common.vmware import Ova
+from vlab_inf_common.vmware.ova import FileHandle
+
+from vlab_datadomain_api.lib import const
+
+_CACHE = {}
+_LOCK = threading.Lock()
+
+
+def get_descriptor(ova_path):
+    """Obtain the parsed OVF, network names and disk layout of an OVA
+
+    :Returns: Dictionary
+
+    :Raises: FileNotFoundError
+
+    :param ova_path: The absolute path to the OVA file
+    :type ova_path: String
+    """
+    stat = os.stat(ova_path)
+    key = [ova_path, stat.st_size, stat.st_mtime_ns]
+    with _LOCK:
+        cached = _CACHE.get(ova_path)
+        if cached and cached['key'] == key:
+            return cached['descriptor']
+    cached = _load(key)
+    if cached is None:
+        cached = {'key': key, 'descriptor': _parse(ova_path)}
+        _save(cached)
+    with _LOCK:
+        _CACHE[ova_path] = cached
+    return cached['descriptor']
+
+
+def deployed_size(descriptor):
+    """Estimate how much datastore space a VM deployed from the OVA can consume:
+    the full capacity of every disk, plus a swap file as big as its memory.
+    The VMDKs within an OVA are compressed, so the OVA's own size is far too low.
+
+    :Returns: Integer
+
+    :Raises: ValueError if the OVF is not valid XML
+
+    :param descriptor: The output of ``get_descriptor``
+    :type descriptor: Dictionary
+    """
+    try:
+        envelope = ElementTree.fromstring(descriptor['ovf'])
+    except ElementTree.ParseError as doh:
+        raise ValueError('Unable to parse OVF: {}'.format(doh))
+    disks = 0
+    memory = 0
+    for elem in envelope.iter():
+        tag = _local_name(elem.tag)
+        if tag == 'Disk':
+            attrs = {_local_name(k): v for k, v in elem.attrib.items()}
+            disks += _to_bytes(attrs.get('capacity'), attrs.get('capacityAllocationUnits', 'byte'))
+        elif tag == 'Item':
+            fields = {_local_name(x.tag): (x.text or '').strip() for x in elem}
+            if fields.get('ResourceType') == '4': # memory
+                # One Item per deployment option; plan for the biggest
+                memory = max(memory, _to_bytes(fields.get('VirtualQuantity'),
+                                               fields.get('AllocationUnits', 'byte * 2^20')))
+    return disks + memory
+
+
+def _local_name(tag):
+    """Drop the XML namespace, i.e. '{http://schemas.dmtf.org/ovf/envelope/1}Disk' -> 'Disk'"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _to_bytes(quantity, units):
+    """Convert an OVF quantity with units like 'byte * 2^30' to bytes"""
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        # Missing, or set by an OVF property at deploy time
+        return 0
+    multiplier = re.search(r'(\d+)\s*\^\s*(\d+)', units or '')
+    if multiplier:
+        quantity *= int(multiplier.group(1)) ** int(multiplier.group(2))
+    return quantity
+
+
+def _parse(ova_path):
+    """Scan the OVA for the OVF, and where each VMDK lives within the tar"""
+    ovf = None
+    disks = {}
+    with tarfile.open(ova_path) as tar:
+        for member in tar.getmembers():
+            if member.name.endswith('.vmdk'):
+                disks[member.name] = [member.offset_data, member.size]
+            elif member.name.endswith('.ovf'):
+                ovf = tar.extractfile(member).read().decode()
+    if ovf is None:
+        raise ValueError('No OVF found within {}'.format(os.path.basename(ova_path)))
+    return {'ovf': ovf, 'networks': _networks(ovf), 'disks': disks}
+
+
+def _networks(ovf):
+    """Same as the ``Ova.networks`` property"""
+    ntwks = re.findall(r'Network ovf:name=[\w\ "]{1,50}', ovf)
+    return [x.split('=')[1].replace('"', '') for x in ntwks]
+
+
+def _cache_file(ova_path):
+    name = hashlib.sha1(ova_path.encode()).hexdigest()
+    return os.path.join(const.VLAB_DATADOMAIN_OVF_CACHE_DIR, '{}.json'.format(name))
+
+
+def _load(key):
+    """Read a descriptor from the on disk cache, if enabled and still valid"""
+    if not const.VLAB_DATADOMAIN_OVF_CACHE_DIR:
+        return None
+    try:
+        with open(_cache_file(key[0])) as the_file:
+            cached = ujson.load(the_file)
+    except (OSError, ValueError):
+        return None
+    if cached.get('key') != key:
+        return None
+    return cached
+
+
+def _save(cached):
+    """Write a descriptor to the on disk cache, if enabled"""
+    if not const.VLAB_DATADOMAIN_OVF_CACHE_DIR:
+        return
+    path = _cache_file(cached['key'][0])
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp, 'w') as the_file:
+            ujson.dump(cached, the_file)
+        # Atomic, so other workers never read a half written file
+        os.rename(tmp, path)
+    except OSError:
+        # The cache is an optimization; a read only dir shouldn't break deploys
+        pass
+
+
+class CachedOva(Ova):
+    """An Ova built from a cached descriptor, instead of by scanning the tar
+
+    :param ova_path: The absolute path to the OVA file
+    :type ova_path: String
+
+    :param descriptor: The output of ``get_descriptor``
+    :type descriptor: Dictionary
+    """
+    def __init__(self, ova_path, descriptor):
+        self._spec = None
+        self._lease = None
+        self._host = None
+        self._prog = None
+        self._handle = FileHandle(ova_path)
+        self._tar = None
+        self._ovf = descriptor['ovf']
+        self._disks = {}
+        for name, (offset, size) in descriptor['disks'].items():
+            self._disks[name] = TarMember(self._handle, offset, size)
+
+
+class TarMember(object):
+    """A read only, file-like, window onto one file within an uncompressed tar
+
+    Reads go through the OVA's FileHandle so the upload progress reported to
+    vCenter stays accurate.
+
+    :param handle: The opened OVA file
+    :type handle: vlab_inf_common.vmware.ova.FileHandle
+
+    :param offset: Where the member's data starts within the tar
+    :type offset: Integer
+
+    :param size: How many bytes the member is
+    :type size: Integer
+    """
+    def __init__(self, handle, offset, size):
+        self._handle = handle
+        self._offset = offset
+        self.size = size
+        self._position = 0
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self._position = offset
+        elif whence == 1:
+            self._position += offset
+        elif whence == 2:
+            self._position = self.size + offset
+        self._position = max(0, min(self._position, self.size))
+        return self._position
+
+    def read(self, amount=-1):
+        remaining = self.size - self._position
+        if amount is None or amount < 0 or amount > remaining:
+            amount = remaining
+        if amount == 0:
+            return b''
+        self._handle.seek(self._offset + self._position)
+        data = self._handle.read(amount)
+        self._position += len(data)
+        return data
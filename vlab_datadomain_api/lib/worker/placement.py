@@ -0,0 +1,234 @@
+# -*- coding: UTF-8 -*-
+"""
+Decides which datastore and ESXi host a new DataDomain is deployed to.
+
+Looking up free space and host mounts costs a pile of vCenter round trips, so
+the answers are cached and only refreshed every ``VLAB_DATADOMAIN_PLACEMENT_REFRESH``
+seconds. Only plain data (names, moIds, bytes) is cached and returned; callers
+bind the moIds to whatever vCenter session they have open.
+
+Celery runs one task per worker process, so deploys that are in-flight are
+recorded as files in ``VLAB_DATADOMAIN_PLACEMENT_DIR``, where every process
+on the worker can see them. Picking a datastore is a weighted random choice,
+so processes with the same cached view still spread their deploys out.
+"""
+import os
+import time
+import uuid
+import random
+import threading
+from collections import namedtuple, defaultdict
+
+import ujson
+
+from vlab_inf_common.vmware import vim
+
+from vlab_datadomain_api.lib import const
+
+Slot = namedtuple('Slot', 'datastore_name host_name datastore_moid host_moid')
+
+
+class Placement(object):
+    """Picks a datastore and host based on free space, how many deploys are
+    in-flight, and how long recent deploys to each datastore took.
+
+    :param candidates: The names of datastores, or datastore clusters, that
+                       new DataDomains can be deployed to.
+    :type candidates: List
+
+    :param refresh: How many seconds to trust the cached datastore info for
+    :type refresh: Integer
+    """
+    # Weight given to the newest deploy time when updating the moving average
+    LATENCY_WEIGHT = 0.3
+    # Reservations older than this (in seconds) are from a deploy that never released them
+    RESERVATION_MAX_AGE = 4 * 3600
+
+    def __init__(self, candidates=const.INF_VCENTER_DATASTORE, refresh=const.VLAB_DATADOMAIN_PLACEMENT_REFRESH,
+                 reservations_dir=const.VLAB_DATADOMAIN_PLACEMENT_DIR):
+        self.candidates = candidates
+        self.refresh = refresh
+        self.reservations_dir = reservations_dir
+        self._lock = threading.Lock()
+        self._refreshed = 0
+        self._datastores = {}
+        self._reservations = defaultdict(list)
+        self._latency = {}
+
+    def choose(self, vcenter, required_bytes):
+        """Reserve a datastore and host for a new deploy. Callers must pass the
+        returned Slot to ``release`` once the deploy is finished (or failed).
+
+        :Returns: Slot
+
+        :Raises: ValueError when no datastore has enough free space
+
+        :param vcenter: An established connection to vCenter
+        :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+        :param required_bytes: How much space the new VM will consume up front
+        :type required_bytes: Integer
+        """
+        with self._lock:
+            if time.time() - self._refreshed > self.refresh:
+                self._refresh(vcenter)
+            inflight = self._inflight()
+            candidates = []
+            for ds_name, info in self._datastores.items():
+                # Space that deploys from other processes are about to use
+                free = info['free'] - inflight['others_bytes'][ds_name]
+                if free >= required_bytes and info['hosts']:
+                    candidates.append((ds_name, info, free))
+            if not candidates:
+                error = 'No datastore has {} GB free for a new DataDomain'.format(round(required_bytes / 1024**3, 1))
+                raise ValueError(error)
+            weights = [self._score(ds_name, free, inflight['datastores'][ds_name]) for ds_name, _, free in candidates]
+            ds_name, info, _ = random.choices(candidates, weights=weights)[0]
+            host_name, host_moid = min(info['hosts'], key=lambda x: (inflight['hosts'][x[0]], random.random()))
+            slot = Slot(ds_name, host_name, info['moid'], host_moid)
+            self._reserve(slot, required_bytes)
+            # Keep the cached view honest until the next refresh
+            info['free'] -= required_bytes
+            return slot
+
+    def max_free(self, vcenter):
+        """The most free space on any usable candidate datastore, as of the last refresh
+
+        :Returns: Integer
+
+        :param vcenter: An established connection to vCenter
+        :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+        """
+        with self._lock:
+            if time.time() - self._refreshed > self.refresh:
+                self._refresh(vcenter)
+            return max([x['free'] for x in self._datastores.values() if x['hosts']], default=0)
+
+    def release(self, slot, seconds=None):
+        """Return a reserved Slot, recording how long the deploy took
+
+        :Returns: None
+
+        :param slot: The value returned by ``choose``
+        :type slot: Slot
+
+        :param seconds: How long the deploy took. Leave unset if the deploy failed.
+        :type seconds: Float
+        """
+        with self._lock:
+            if self._reservations[slot]:
+                _remove(self._reservations[slot].pop())
+            if seconds is not None:
+                previous = self._latency.get(slot.datastore_name, seconds)
+                self._latency[slot.datastore_name] = (self.LATENCY_WEIGHT * seconds) + ((1 - self.LATENCY_WEIGHT) * previous)
+
+    def _score(self, ds_name, free, inflight):
+        """Higher is better. Free space, discounted by in-flight deploys and by
+        how slow deploys to the datastore have been relative to the others."""
+        if self._latency:
+            average = sum(self._latency.values()) / len(self._latency)
+            relative_latency = self._latency.get(ds_name, average) / average if average else 1
+        else:
+            relative_latency = 1
+        return max(free, 1) / ((1 + inflight) * relative_latency)
+
+    def _reserve(self, slot, required_bytes):
+        """Record an in-flight deploy where every worker process can see it"""
+        path = os.path.join(self.reservations_dir, '{}.{}.json'.format(os.getpid(), uuid.uuid4().hex))
+        try:
+            os.makedirs(self.reservations_dir, exist_ok=True)
+            with open(path, 'w') as the_file:
+                ujson.dump({'datastore': slot.datastore_name,
+                            'host': slot.host_name,
+                            'bytes': required_bytes,
+                            'started': time.time()}, the_file)
+        except OSError:
+            # Never fail a deploy over this; placement just can't see this one
+            return
+        self._reservations[slot].append(path)
+
+    def _inflight(self):
+        """Count the deploys in-flight from every process on this worker
+
+        :Returns: Dictionary of per datastore counts, per host counts, and the
+                  bytes reserved on each datastore by other processes
+        """
+        counts = {'datastores': defaultdict(int), 'hosts': defaultdict(int), 'others_bytes': defaultdict(int)}
+        try:
+            names = os.listdir(self.reservations_dir)
+        except FileNotFoundError:
+            return counts
+        for name in names:
+            path = os.path.join(self.reservations_dir, name)
+            try:
+                pid = int(name.split('.')[0])
+                with open(path) as the_file:
+                    reservation = ujson.load(the_file)
+            except (OSError, ValueError):
+                # Not a reservation, released while we were looking, or still being written
+                continue
+            if time.time() - reservation['started'] > self.RESERVATION_MAX_AGE or not _alive(pid):
+                _remove(path)
+                continue
+            counts['datastores'][reservation['datastore']] += 1
+            counts['hosts'][reservation['host']] += 1
+            if pid != os.getpid():
+                counts['others_bytes'][reservation['datastore']] += reservation['bytes']
+        return counts
+
+    def _refresh(self, vcenter):
+        """Look up the free space and usable hosts of every candidate datastore"""
+        try:
+            self._datastores = self._lookup(vcenter)
+        except Exception:
+            if not self._datastores:
+                raise
+            # vCenter hiccup; keep placing with the info we already have
+        self._refreshed = time.time()
+
+    def _lookup(self, vcenter):
+        datastores = {}
+        pods = vcenter.datastores # datastore clusters
+        plain = None
+        for name in self.candidates:
+            if name in pods:
+                members = pods[name].childEntity
+            else:
+                if plain is None:
+                    plain = {x.name: x for x in vcenter.get_by_type(vim.Datastore)}
+                members = [plain[name]] if name in plain else []
+            for datastore in members:
+                summary = datastore.summary
+                if not summary.accessible:
+                    continue
+                hosts = []
+                for mount in datastore.host:
+                    runtime = mount.key.runtime
+                    if runtime.connectionState == 'connected' and not runtime.inMaintenanceMode:
+                        hosts.append((mount.key.name, mount.key._moId))
+                datastores[datastore.name] = {'moid': datastore._moId,
+                                              'free': summary.freeSpace,
+                                              'hosts': hosts}
+        return datastores
+
+
+def _alive(pid):
+    """True if the process that made a reservation is still running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# One per worker process, so the cache outlives any single task
+PLACEMENT = Placement()
@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+"""
+Opt-in profiling of a single task, for digging into why one request was slow.
+
+A profiled task runs under cProfile, and a summary (the slowest functions, and
+how many round trips were made to vCenter) is written to
+``VLAB_DATADOMAIN_PROFILE_DIR``, under the user who sent the request and named
+after the request's txn_id. Tasks that are not profiled never touch cProfile.
+"""
+import os
+import time
+import pstats
+import cProfile
+import contextlib
+
+import ujson
+from pyVmomi.SoapAdapter import SoapStubAdapter
+
+from vlab_datadomain_api.lib import const
+
+# Every request pyVmomi sends to vCenter, method call or property read, goes through here
+_ROUND_TRIP = SoapStubAdapter.InvokeMethod.__code__
+# How many functions to include in the summary
+TOP_FUNCTIONS = 40
+
+
+@contextlib.contextmanager
+def capture(username, txn_id, task_name, enabled=False):
+    """Profile the body of the ``with`` block, if enabled
+
+    :Returns: None
+
+    :param username: The user who sent the request being profiled
+    :type username: String
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+
+    :param task_name: The name of the task being profiled
+    :type task_name: String
+
+    :param enabled: Set to True to actually profile
+    :type enabled: Boolean
+    """
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    started = time.time()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _save(username, txn_id, summarize(profiler, task_name, time.time() - started))
+
+
+def summarize(profiler, task_name, seconds):
+    """Reduce the raw profile to something small enough to send back to a user
+
+    :Returns: Dictionary
+
+    :param profiler: A profiler that has been run
+    :type profiler: cProfile.Profile
+
+    :param task_name: The name of the task that was profiled
+    :type task_name: String
+
+    :param seconds: How long the task took
+    :type seconds: Float
+    """
+    stats = pstats.Stats(profiler)
+    round_trips = 0
+    functions = []
+    for (filename, lineno, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        if filename == _ROUND_TRIP.co_filename and lineno == _ROUND_TRIP.co_firstlineno:
+            round_trips += calls
+        functions.append({'function': '{}:{}({})'.format(filename, lineno, name),
+                          'calls': calls,
+                          'total': round(total, 6),
+                          'cumulative': round(cumulative, 6)})
+    functions.sort(key=lambda x: x['cumulative'], reverse=True)
+    return {'task': task_name,
+            'seconds': round(seconds, 6),
+            'vcenter_round_trips': round_trips,
+            'functions': functions[:TOP_FUNCTIONS]}
+
+
+def load(username, txn_id):
+    """Read back one of the user's profiles saved by ``capture``
+
+    :Returns: Dictionary
+
+    :Raises: ValueError if the user has no profile for the txn_id
+
+    :param username: The user who sent the profiled request
+    :type username: String
+
+    :param txn_id: The txn_id of the profiled request
+    :type txn_id: String
+    """
+    try:
+        with open(_profile_file(username, txn_id)) as the_file:
+            return ujson.load(the_file)
+    except FileNotFoundError:
+        raise ValueError('No profile found for {}'.format(txn_id))
+
+
+def _profile_file(username, txn_id):
+    # The txn_id comes from a request header; don't let it pick the directory
+    name = os.path.basename(txn_id)
+    return os.path.join(const.VLAB_DATADOMAIN_PROFILE_DIR, os.path.basename(username), '{}.json'.format(name))
+
+
+def _save(username, txn_id, summary):
+    try:
+        profile_file = _profile_file(username, txn_id)
+        os.makedirs(os.path.dirname(profile_file), exist_ok=True)
+        with open(profile_file, 'w') as the_file:
+            ujson.dump(summary, the_file)
+    except OSError:
+        # Never fail the task being profiled just because the profile couldn't be saved
+        pass
@@ -0,0 +1,158 @@
+# -*- coding: UTF-8 -*-
+"""
+Retries and a circuit breaker for calls to vCenter.
+
+Transient faults (dropped connections, hosts briefly unreachable) are retried
+with jittered exponential backoff. Enough of them in a row trips the breaker,
+after which calls fail immediately until ``VLAB_DATADOMAIN_BREAKER_RESET``
+seconds have passed and a single trial call succeeds. That way a vCenter
+outage costs a worker milliseconds, not minutes of blocking on timeouts.
+"""
+import time
+import socket
+import random
+import threading
+import http.client
+
+from pyVmomi import vmodl
+from vlab_inf_common.vmware import vim
+
+from vlab_datadomain_api.lib import const
+
+TRANSIENT_FAULTS = (ConnectionError,
+                    socket.timeout,
+                    http.client.HTTPException,
+                    vmodl.fault.HostCommunication,
+                    vim.fault.HostConnectFault)
+
+# Longest single wait between retries, in seconds
+MAX_BACKOFF = 30
+
+
+# Like vlab_inf_common's DeployFailure, subclassing ValueError means the existing
+# task code reports it to the user instead of the task blowing up.
+class CircuitOpenError(ValueError):
+    pass
+
+
+class CircuitBreaker(object):
+    """Tracks consecutive transient faults from vCenter.
+
+    :param threshold: How many transient faults in a row open the circuit
+    :type threshold: Integer
+
+    :param reset_timeout: How many seconds the circuit stays open before a trial call is allowed
+    :type reset_timeout: Integer
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=const.VLAB_DATADOMAIN_BREAKER_THRESHOLD,
+                 reset_timeout=const.VLAB_DATADOMAIN_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._lock = threading.Lock()
+
+    @property
+    def retry_after(self):
+        """How many seconds until a trial call will be allowed
+
+        :Returns: Integer
+        """
+        if self.state == self.CLOSED:
+            return 0
+        return max(0, int(self._opened_at + self.reset_timeout - time.time()) + 1)
+
+    @property
+    def is_open(self):
+        """True if a call made right now would be rejected
+
+        :Returns: Boolean
+        """
+        if self.state == self.OPEN:
+            return time.time() - self._opened_at < self.reset_timeout
+        return self.state == self.HALF_OPEN
+
+    def before_call(self):
+        """Reject the call if the circuit is open
+
+        :Raises: CircuitOpenError
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                # Let this one call through to see if vCenter is back
+                self.state = self.HALF_OPEN
+                return
+        error = 'vCenter is unavailable, try again in {} seconds'.format(self.retry_after)
+        raise CircuitOpenError(error)
+
+    def record_success(self):
+        """vCenter answered"""
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        """vCenter did not answer"""
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.threshold:
+                self.state = self.OPEN
+                self._opened_at = time.time()
+
+
+def backoff(attempt):
+    """Full jitter exponential backoff
+
+    :Returns: Float
+
+    :param attempt: Which retry this is, starting at zero
+    :type attempt: Integer
+    """
+    return random.uniform(0, min(MAX_BACKOFF, const.VLAB_DATADOMAIN_VCENTER_BACKOFF * 2 ** attempt))
+
+
+def vsphere_call(func, *args, idempotent=True, **kwargs):
+    """Call a function that talks to vCenter, retrying transient faults
+
+    Any other exception still means vCenter answered, so it counts as a success
+    for the circuit breaker and is raised to the caller as-is.
+
+    :Returns: Whatever ``func`` returns
+
+    :Raises: CircuitOpenError
+
+    :param func: The thing that talks to vCenter
+    :type func: Callable
+
+    :param idempotent: Set to False for calls that are unsafe to repeat, like
+                       destroying a VM. They are sent once, but still go
+                       through the circuit breaker.
+    :type idempotent: Boolean
+    """
+    attempts = const.VLAB_DATADOMAIN_VCENTER_RETRIES + 1 if idempotent else 1
+    for attempt in range(attempts):
+        BREAKER.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except TRANSIENT_FAULTS:
+            BREAKER.record_failure()
+            if attempt + 1 == attempts:
+                raise
+            time.sleep(backoff(attempt))
+        except Exception:
+            BREAKER.record_success()
+            raise
+        else:
+            BREAKER.record_success()
+            return result
+
+
+# One per worker process, shared by every task that process runs
+BREAKER = CircuitBreaker()
@@ -3,16 +3,36 @@
 Entry point logic for available backend worker tasks
 """
 from celery import Celery
+from celery.exceptions import SoftTimeLimitExceeded
 from vlab_api_common import get_task_logger
 
-from vlab_datadomain_api.lib import const
-from vlab_datadomain_api.lib.worker import vmware
+from vlab_datadomain_api.lib import const, ownership
+from vlab_datadomain_api.lib.worker import vmware, profiling
+from vlab_datadomain_api.lib.worker.resilience import BREAKER, CircuitOpenError, TRANSIENT_FAULTS
 
 app = Celery('datadomain', backend='rpc://', broker=const.VLAB_MESSAGE_BROKER)
 
 
+def _defer_if_vcenter_down(task, logger):
+    """Put a task back on the queue, instead of starting work that will fail,
+    while vCenter calls are being rejected by the circuit breaker. After
+    ``VLAB_DATADOMAIN_DEFER_RETRIES`` deferrals the task runs anyway, and fails fast.
+
+    :Raises: celery.exceptions.Retry
+
+    :param task: The bound task instance
+    :type task: celery.Task
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    if BREAKER.is_open and task.request.retries < const.VLAB_DATADOMAIN_DEFER_RETRIES:
+        logger.info('vCenter unavailable, deferring task for {} seconds'.format(BREAKER.retry_after))
+        raise task.retry(countdown=BREAKER.retry_after, max_retries=const.VLAB_DATADOMAIN_DEFER_RETRIES)
+
+
 @app.task(name='datadomain.show', bind=True)
-def show(self, username, txn_id):
+def show(self, username, txn_id, profile=False):
     """Obtain basic information about DataDomain
 
     :Returns: Dictionary
@@ -22,23 +42,76 @@ def show(self, username, txn_id):
 
     :param txn_id: A unique string supplied by the client to track the call through logs
     :type txn_id: String
+
+    :param profile: Set to True to save a profile of the task under the txn_id
+    :type profile: Boolean
     """
     logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
     try:
-        info = vmware.show_datadomain(username)
+        with profiling.capture(username, txn_id, self.name, enabled=profile):
+            info = vmware.show_datadomain(username)
     except ValueError as doh:
         logger.error('Task failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
+    except TRANSIENT_FAULTS as doh:
+        # Still failing after vsphere_call ran out of retries
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = 'vCenter unavailable: {}'.format(doh)
+    except SoftTimeLimitExceeded:
+        logger.info('Task cancelled')
+        resp['error'] = 'Task cancelled'
     else:
         logger.info('Task complete')
         resp['content'] = info
     return resp
 
 
+@app.task(name='datadomain.inventory', bind=True)
+def inventory(self, version, state, offset, limit, txn_id):
+    """Obtain basic information about every user's DataDomain
+
+    :Returns: Dictionary
+
+    :param version: Only include DataDomains of this version. Set to None to include all versions.
+    :type version: String
+
+    :param state: Only include DataDomains in this power state. Set to None to include all states.
+    :type state: String
+
+    :param offset: How many DataDomains to skip over
+    :type offset: Integer
+
+    :param limit: The most DataDomains to return
+    :type limit: Integer
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    _defer_if_vcenter_down(self, logger)
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.inventory_datadomain(version=version, state=state, offset=offset, limit=limit)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    except TRANSIENT_FAULTS as doh:
+        # Still failing after vsphere_call ran out of retries
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = 'vCenter unavailable: {}'.format(doh)
+    except SoftTimeLimitExceeded:
+        logger.info('Task cancelled')
+        resp['error'] = 'Task cancelled'
+    else:
+        logger.info('Task complete')
+    return resp
+
+
 @app.task(name='datadomain.create', bind=True)
-def create(self, username, machine_name, image, network, txn_id):
+def create(self, username, machine_name, image, network, txn_id, snapshot=False, profile=False):
     """Deploy a new instance of DataDomain
 
     :Returns: Dictionary
@@ -57,21 +130,36 @@ def create(self, username, machine_name, image, network, txn_id):
 
     :param txn_id: A unique string supplied by the client to track the call through logs
     :type txn_id: String
+
+    :param snapshot: Set to True to take a baseline snapshot, enabling fast resets
+    :type snapshot: Boolean
+
+    :param profile: Set to True to save a profile of the task under the txn_id
+    :type profile: Boolean
     """
     logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
     resp = {'content' : {}, 'error': None, 'params': {}}
+    _defer_if_vcenter_down(self, logger)
     logger.info('Task starting')
     try:
-        resp['content'] = vmware.create_datadomain(username, machine_name, image, network, logger)
+        with profiling.capture(username, txn_id, self.name, enabled=profile):
+            resp['content'] = vmware.create_datadomain(username, machine_name, image, network, logger, snapshot=snapshot)
     except ValueError as doh:
         logger.error('Task failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
+    except TRANSIENT_FAULTS as doh:
+        # Still failing after vsphere_call ran out of retries
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = 'vCenter unavailable: {}'.format(doh)
+    except SoftTimeLimitExceeded:
+        logger.info('Task cancelled')
+        resp['error'] = 'Task cancelled'
     logger.info('Task complete')
     return resp
 
 
 @app.task(name='datadomain.delete', bind=True)
-def delete(self, username, machine_name, txn_id):
+def delete(self, username, machine_name, txn_id, wait=True, profile=False):
     """Destroy an instance of DataDomain
 
     :Returns: Dictionary
@@ -84,15 +172,161 @@ def delete(self, username, machine_name, txn_id):
 
     :param txn_id: A unique string supplied by the client to track the call through logs
     :type txn_id: String
+
+    :param wait: Set to False to return once the destroy has been issued. The
+                 returned content has the id of a task that tracks it to completion.
+    :type wait: Boolean
+
+    :param profile: Set to True to save a profile of the task under the txn_id
+    :type profile: Boolean
     """
     logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
     resp = {'content' : {}, 'error': None, 'params': {}}
+    _defer_if_vcenter_down(self, logger)
     logger.info('Task starting')
     try:
-        vmware.delete_datadomain(username, machine_name, logger)
+        with profiling.capture(username, txn_id, self.name, enabled=profile):
+            if wait:
+                vmware.delete_datadomain(username, machine_name, logger)
+            else:
+                progress = vmware.begin_delete(username, machine_name, logger)
+                # Same reply_to, so the tracker's result goes to whoever asked for the delete
+                tracker = delete_poll.apply_async([username, machine_name, progress, txn_id],
+                                                  countdown=const.VLAB_DATADOMAIN_DELETE_POLL,
+                                                  reply_to=self.request.reply_to,
+                                                  task_id=ownership.new_task_id(username))
+                resp['content'] = {'state': 'deleting', 'tracker': tracker.id}
     except ValueError as doh:
         logger.error('Task failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
+    except TRANSIENT_FAULTS as doh:
+        # Still failing after vsphere_call ran out of retries
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = 'vCenter unavailable: {}'.format(doh)
+    except SoftTimeLimitExceeded:
+        logger.info('Task cancelled')
+        resp['error'] = 'Task cancelled'
+    else:
+        logger.info('Task complete')
+    return resp
+
+
+@app.task(name='datadomain.delete_poll', bind=True,
+          max_retries=const.VLAB_DATADOMAIN_DELETE_TIMEOUT // const.VLAB_DATADOMAIN_DELETE_POLL)
+def delete_poll(self, username, machine_name, progress, txn_id):
+    """Track a delete started with ``wait`` set to False until the VM is destroyed.
+    Between checks the task goes back on the queue, instead of holding a worker.
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who is deleting an instance of DataDomain
+    :type username: String
+
+    :param machine_name: The name of the instance of DataDomain
+    :type machine_name: String
+
+    :param progress: How far along the delete is; see ``vmware.check_delete``
+    :type progress: Dictionary
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.debug('Task starting')
+    try:
+        progress = vmware.check_delete(progress, logger)
+    except (CircuitOpenError,) + TRANSIENT_FAULTS as doh:
+        # vCenter being unreachable says nothing about the delete; check again later
+        logger.info('Unable to reach vCenter, will check again: {}'.format(doh))
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+        return resp
+    except SoftTimeLimitExceeded:
+        logger.info('Task cancelled')
+        resp['error'] = 'Task cancelled'
+        return resp
+    if progress['stage'] == 'done':
+        logger.info('Task complete')
+    elif self.request.retries >= self.max_retries:
+        resp['error'] = 'Timed out waiting on vCenter to delete {}'.format(machine_name)
+        logger.error('Task failed: {}'.format(resp['error']))
+    else:
+        raise self.retry(args=[username, machine_name, progress, txn_id], countdown=const.VLAB_DATADOMAIN_DELETE_POLL)
+    return resp
+
+
+@app.task(name='datadomain.power', bind=True)
+def power(self, username, machine_names, state, txn_id):
+    """Turn on/off/restart many instances of DataDomain
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who owns the instances of DataDomain
+    :type username: String
+
+    :param machine_names: The names of the instances of DataDomain
+    :type machine_names: List
+
+    :param state: The power state to put the instances into. Valid values are "on" "off" and "restart"
+    :type state: String
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    _defer_if_vcenter_down(self, logger)
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.power_datadomains(username, machine_names, state, logger)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    except TRANSIENT_FAULTS as doh:
+        # Still failing after vsphere_call ran out of retries
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = 'vCenter unavailable: {}'.format(doh)
+    except SoftTimeLimitExceeded:
+        logger.info('Task cancelled')
+        resp['error'] = 'Task cancelled'
+    else:
+        logger.info('Task complete')
+    return resp
+
+
+@app.task(name='datadomain.reset', bind=True)
+def reset(self, username, machine_name, txn_id):
+    """Revert an instance of DataDomain to the state it was created in
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who wants to reset an instance of DataDomain
+    :type username: String
+
+    :param machine_name: The name of the instance of DataDomain
+    :type machine_name: String
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    _defer_if_vcenter_down(self, logger)
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.reset_datadomain(username, machine_name, logger)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    except TRANSIENT_FAULTS as doh:
+        # Still failing after vsphere_call ran out of retries
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = 'vCenter unavailable: {}'.format(doh)
+    except SoftTimeLimitExceeded:
+        logger.info('Task cancelled')
+        resp['error'] = 'Task cancelled'
     else:
         logger.info('Task complete')
     return resp
@@ -110,6 +344,62 @@ def image(self, txn_id):
     logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
-    resp['content'] = {'image': vmware.list_images()}
-    logger.info('Task complete')
+    try:
+        resp['content'] = {'image': vmware.list_images()}
+    except SoftTimeLimitExceeded:
+        logger.info('Task cancelled')
+        resp['error'] = 'Task cancelled'
+    else:
+        logger.info('Task complete')
+    return resp
+
+
+@app.task(name='datadomain.profile', bind=True)
+def fetch_profile(self, username, profiled_txn_id, txn_id):
+    """Obtain the profile saved by a task that was run with profiling enabled
+
+    :Returns: Dictionary
+
+    :param username: The user who sent the profiled request
+    :type username: String
+
+    :param profiled_txn_id: The txn_id of the request that was profiled
+    :type profiled_txn_id: String
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        resp['content'] = profiling.load(username, profiled_txn_id)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    except SoftTimeLimitExceeded:
+        logger.info('Task cancelled')
+        resp['error'] = 'Task cancelled'
+    else:
+        logger.info('Task complete')
+    return resp
+
+
+@app.task(name='datadomain.health', bind=True)
+def health(self, txn_id):
+    """Report on the things this worker needs in order to run other tasks
+
+    :Returns: Dictionary
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_DATADOMAIN_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    # Sent every few seconds by every API process; keep it out of the INFO logs
+    logger.debug('Task starting')
+    images_dir = vmware.images_available()
+    resp['content'] = {'images_dir': images_dir,
+                       'images': vmware.list_images() if images_dir else None}
+    logger.debug('Task complete')
     return resp
@@ -1,11 +1,32 @@
 # -*- coding: UTF-8 -*-
 """Business logic for backend worker tasks"""
+import re
 import time
 import random
 import os.path
-from vlab_inf_common.vmware import vCenter, Ova, vim, virtual_machine, consume_task
+import collections
+from pyVmomi import vmodl
+from celery.exceptions import SoftTimeLimitExceeded
+from vlab_inf_common.vmware import vCenter, vim, virtual_machine, consume_task
 
 from vlab_datadomain_api.lib import const
+from vlab_datadomain_api.lib.worker import ovf_cache, inventory
+from vlab_datadomain_api.lib.worker.placement import PLACEMENT
+from vlab_datadomain_api.lib.worker.resilience import vsphere_call, CircuitOpenError, TRANSIENT_FAULTS
+
+BASELINE_SNAPSHOT = 'vlab-baseline'
+# The most seconds to spend powering off a VM that's being thrown away
+DISCARD_TIMEOUT = 60
+HOSTNAME_REGEX = r'^(([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])\.)*([A-Za-z0-9]|[A-Za-z0-9][A-Za-z0-9\-]*[A-Za-z0-9])$'
+
+
+def _connect():
+    """Log into vCenter, retrying transient faults
+
+    :Returns: vlab_inf_common.vmware.vcenter.vCenter
+    """
+    return vsphere_call(vCenter, host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER,
+                        password=const.INF_VCENTER_PASSWORD)
 
 
 def show_datadomain(username):
@@ -17,17 +38,146 @@ def show_datadomain(username):
     :type username: String
     """
     info = {}
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+    with _connect() as vcenter:
+        folder = vsphere_call(vcenter.get_by_name, name=username, vimtype=vim.Folder)
         datadomain_vms = {}
-        for vm in folder.childEntity:
-            info = virtual_machine.get_info(vcenter, vm, username)
+        for vm in vsphere_call(getattr, folder, 'childEntity'):
+            info = vsphere_call(virtual_machine.get_info, vcenter, vm, username)
             if info['meta']['component'] == 'DataDomain':
                 datadomain_vms[vm.name] = info
     return datadomain_vms
 
 
+def inventory_datadomain(version=None, state=None, offset=0, limit=const.VLAB_DATADOMAIN_INVENTORY_PAGE):
+    """Obtain basic information about every user's DataDomain, one page at a time
+
+    :Returns: Dictionary
+
+    :Raises: ValueError if the top level folder of vLab does not exist
+
+    :param version: Only include DataDomains of this version
+    :type version: String
+
+    :param state: Only include DataDomains in this power state, i.e. poweredOn
+    :type state: String
+
+    :param offset: How many DataDomains to skip over
+    :type offset: Integer
+
+    :param limit: The most DataDomains to return
+    :type limit: Integer
+    """
+    with _connect() as vcenter:
+        try:
+            root = vsphere_call(vcenter.get_vm_folder, path=const.INF_VCENTER_TOP_LVL_DIR)
+        except FileNotFoundError:
+            raise ValueError('No such folder {}'.format(const.INF_VCENTER_TOP_LVL_DIR))
+        vms = inventory.list_datadomains(vcenter, root, version=version, state=state)
+    return {'total': len(vms),
+            'offset': offset,
+            'limit': limit,
+            'vms': vms[offset:offset + limit]}
+
+
+def power_datadomains(username, machine_names, state, logger):
+    """Turn on/off/restart many of a user's DataDomains at once
+
+    All the power operations are started before waiting on any of them, so
+    the whole batch takes about as long as the slowest VM.
+
+    :Returns: Dictionary mapping each name to the outcome of its power operation
+
+    :param username: The user who owns the DataDomains
+    :type username: String
+
+    :param machine_names: The names of the DataDomains to power on/off/restart
+    :type machine_names: List
+
+    :param state: The power state to put the VMs into. Valid values are "on" "off" and "restart"
+    :type state: String
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    results = {}
+    started = {}
+    with _connect() as vcenter:
+        folder = vsphere_call(vcenter.get_by_name, name=username, vimtype=vim.Folder)
+        found = inventory.find_datadomains(vcenter, folder, machine_names)
+        for name in machine_names:
+            if name not in found:
+                results[name] = {'ok': False, 'seconds': 0, 'error': 'No datadomain named {} found'.format(name)}
+                continue
+            the_vm, current = found[name]
+            current = current.lower().replace('powered', '')
+            if current == state:
+                results[name] = {'ok': True, 'seconds': 0, 'error': None}
+                continue
+            # Same choices as virtual_machine.power
+            if state == 'on' or (current == 'off' and state == 'restart'):
+                method = the_vm.PowerOn
+            elif state == 'off':
+                method = the_vm.PowerOff
+            else:
+                method = the_vm.ResetVM_Task
+            try:
+                task = vsphere_call(method, idempotent=False)
+            except vmodl.MethodFault as doh:
+                results[name] = {'ok': False, 'seconds': 0, 'error': doh.msg}
+            except (CircuitOpenError,) + TRANSIENT_FAULTS as doh:
+                # Sent once, so report it and carry on; VMs already started still need tracking
+                results[name] = {'ok': False, 'seconds': 0, 'error': 'Unable to reach vCenter: {}'.format(doh)}
+            else:
+                started[name] = (task, time.time())
+        logger.info('Waiting on {} power operations'.format(len(started)))
+        results.update(_wait_for_tasks(vcenter, started))
+    return results
+
+
+def _wait_for_tasks(vcenter, started, timeout=const.VLAB_DATADOMAIN_POWER_TIMEOUT):
+    """Wait on many vCenter tasks together, checking all of them in one round trip
+
+    :Returns: Dictionary mapping each name to the outcome of its task
+
+    :param vcenter: An established connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param started: Maps a name to a Tuple (vim.Task, Float time the task was started)
+    :type started: Dictionary
+
+    :param timeout: How many seconds to wait for all the tasks to complete
+    :type timeout: Integer
+    """
+    results = {}
+    pending = dict(started)
+    collector = vsphere_call(getattr, vcenter, 'content').propertyCollector
+    deadline = time.time() + timeout
+    while pending:
+        names = {task._moId: name for name, (task, _) in pending.items()}
+        objects = [vmodl.query.PropertyCollector.ObjectSpec(obj=task) for task, _ in pending.values()]
+        props = vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=['info.state', 'info.error'])
+        spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=objects, propSet=[props])
+        for obj_content in vsphere_call(collector.RetrieveContents, [spec]):
+            info = {x.name: x.val for x in obj_content.propSet}
+            if info['info.state'] not in ('success', 'error'):
+                continue
+            name = names[obj_content.obj._moId]
+            _, start = pending.pop(name)
+            error = info.get('info.error')
+            results[name] = {'ok': error is None,
+                             'seconds': round(time.time() - start, 3),
+                             'error': error.msg if error is not None else None}
+        if pending and time.time() > deadline:
+            for name, (_, start) in pending.items():
+                results[name] = {'ok': False,
+                                 'seconds': round(time.time() - start, 3),
+                                 'error': 'Timed out after {} seconds'.format(timeout)}
+            break
+        if pending:
+            time.sleep(1)
+    return results
+
+
 def delete_datadomain(username, machine_name, logger):
     """Unregister and destroy a user's DataDomain
 
@@ -42,24 +192,117 @@ def delete_datadomain(username, machine_name, logger):
     :param logger: An object for logging messages
     :type logger: logging.LoggerAdapter
     """
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
-        for entity in folder.childEntity:
-            if entity.name == machine_name:
-                info = virtual_machine.get_info(vcenter, entity, username)
-                if info['meta']['component'] == 'DataDomain':
-                    logger.debug('powering off VM')
-                    virtual_machine.power(entity, state='off')
-                    delete_task = entity.Destroy_Task()
-                    logger.debug('blocking while VM is being destroyed')
-                    consume_task(delete_task)
-                    break
+    with _connect() as vcenter:
+        entity = _find_datadomain(vcenter, username, machine_name)
+        logger.debug('powering off VM')
+        vsphere_call(virtual_machine.power, entity, state='off')
+        delete_task = vsphere_call(entity.Destroy_Task, idempotent=False)
+        logger.debug('blocking while VM is being destroyed')
+        vsphere_call(consume_task, delete_task)
+
+
+def begin_delete(username, machine_name, logger):
+    """Start destroying a user's DataDomain, without waiting on vCenter to finish.
+    The VM is marked as deleting in its meta data, so ``show`` reports it as such.
+
+    :Returns: Dictionary describing the progress, to pass to ``check_delete``
+
+    :param username: The user who wants to delete their DataDomain
+    :type username: String
+
+    :param machine_name: The name of the VM to delete
+    :type machine_name: String
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    with _connect() as vcenter:
+        the_vm = _find_datadomain(vcenter, username, machine_name)
+        # Before the power off/destroy, because vCenter won't reconfigure a VM
+        # that's in the middle of either
+        _mark_deleting(the_vm, True, logger)
+        try:
+            if vsphere_call(getattr, the_vm, 'runtime').powerState == 'poweredOff':
+                logger.debug('destroying VM')
+                task = vsphere_call(the_vm.Destroy_Task, idempotent=False)
+                stage = 'destroy'
+            else:
+                logger.debug('powering off VM')
+                task = vsphere_call(the_vm.PowerOff, idempotent=False)
+                stage = 'power'
+        except (vmodl.MethodFault, CircuitOpenError) + TRANSIENT_FAULTS:
+            # The delete never started, so don't leave the VM claiming it did
+            _mark_deleting(the_vm, False, logger)
+            raise
+        return {'vm': the_vm._moId, 'task': task._moId, 'stage': stage}
+
+
+def check_delete(progress, logger):
+    """Check on a delete started by ``begin_delete``, issuing the destroy once
+    the VM has powered off. Only the moIds are kept between checks, so any
+    worker can pick up where another left off.
+
+    :Returns: Dictionary of the new progress. The stage is "done" once the VM is destroyed.
+
+    :Raises: ValueError if vCenter failed to power off or destroy the VM. The
+             VM is no longer marked as deleting.
+
+    :param progress: The output of ``begin_delete``, or of a previous ``check_delete``
+    :type progress: Dictionary
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    with _connect() as vcenter:
+        info = vsphere_call(getattr, _bind(vcenter, vim.Task, progress['task']), 'info')
+        the_vm = _bind(vcenter, vim.VirtualMachine, progress['vm'])
+        if info.state in ('queued', 'running'):
+            return progress
+        elif info.state == 'error':
+            action = 'power off' if progress['stage'] == 'power' else 'destroy'
+            _mark_deleting(the_vm, False, logger)
+            raise ValueError('Unable to {} VM: {}'.format(action, info.error.msg))
+        elif progress['stage'] == 'power':
+            logger.debug('destroying VM')
+            try:
+                task = vsphere_call(the_vm.Destroy_Task, idempotent=False)
+            except vmodl.MethodFault as doh:
+                _mark_deleting(the_vm, False, logger)
+                raise ValueError('Unable to destroy VM: {}'.format(doh.msg))
+            return {'vm': progress['vm'], 'task': task._moId, 'stage': 'destroy'}
+        return {'vm': progress['vm'], 'task': progress['task'], 'stage': 'done'}
+
+
+def _mark_deleting(the_vm, deleting, logger):
+    """Set, or clear, the flag in a VM's meta data that has ``show`` report it
+    as being deleted. The flag is only informational, so failing to update it
+    is logged rather than failing the delete.
+
+    :Returns: None
+
+    :param the_vm: The VM being deleted
+    :type the_vm: vim.VirtualMachine
+
+    :param deleting: Set to True to flag the VM, and False to clear the flag
+    :type deleting: Boolean
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    try:
+        meta = inventory.parse_meta(vsphere_call(getattr, the_vm, 'config').annotation)
+        if deleting:
+            meta['deleting'] = True
         else:
-            raise ValueError('No {} named {} found'.format('datadomain', machine_name))
+            meta.pop('deleting', None)
+        vsphere_call(virtual_machine.set_meta, the_vm, meta)
+    except (vmodl.MethodFault, RuntimeError, ValueError) + TRANSIENT_FAULTS as doh:
+        # set_meta raises RuntimeError if the reconfigure fails, and ValueError
+        # (or CircuitOpenError) if it can't be sent at all
+        logger.error('Unable to update the deleting flag of VM {}: {}'.format(the_vm._moId, doh))
 
 
-def create_datadomain(username, machine_name, image, network, logger):
+def create_datadomain(username, machine_name, image, network, logger, snapshot=False):
     """Deploy a new instance of DataDomain
 
     :Returns: Dictionary
@@ -78,39 +321,326 @@ def create_datadomain(username, machine_name, image, network, logger):
 
     :param logger: An object for logging messages
     :type logger: logging.LoggerAdapter
+
+    :param snapshot: Set to True to take a snapshot of the freshly deployed VM,
+                     so it can later be quickly reset via ``reset_datadomain``.
+    :type snapshot: Boolean
     """
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER,
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        image_name = convert_name(image)
-        logger.info(image_name)
-        ova = Ova(os.path.join(const.VLAB_DATADOMAIN_IMAGES_DIR, image_name))
+    with _connect() as vcenter:
+        the_vm = None
+        placed = None
         try:
+            ova_path, descriptor, the_network = preflight(vcenter, username, machine_name, image, network)
             network_map = vim.OvfManager.NetworkMapping()
-            network_map.name = ova.networks[0]
+            network_map.name = descriptor['networks'][0]
+            network_map.network = the_network
+            ova = ovf_cache.CachedOva(ova_path, descriptor)
             try:
-                network_map.network = vcenter.networks[network]
-            except KeyError:
-                raise ValueError('No such network named {}'.format(network))
-            the_vm = virtual_machine.deploy_from_ova(vcenter=vcenter,
-                                                     ova=ova,
-                                                     network_map=[network_map],
-                                                     username=username,
-                                                     machine_name=machine_name,
-                                                     logger=logger,
-                                                     power_on=False)
-        finally:
-            ova.close()
-
-        virtual_machine.add_vmdk(the_vm, disk_size=500) # GB
-        virtual_machine.power(the_vm, state='on')
-        meta_data = {'component' : "DataDomain",
-                     'created' : time.time(),
-                     'version' : image,
-                     'configured' : False,
-                     'generation' : 1}
-        virtual_machine.set_meta(the_vm, meta_data)
-        info = virtual_machine.get_info(vcenter, the_vm, username, ensure_ip=True)
-        return  {the_vm.name: info}
+                slot = vsphere_call(PLACEMENT.choose, vcenter, required_bytes=ovf_cache.deployed_size(descriptor))
+                logger.info('Deploying {} to datastore {} on host {}'.format(os.path.basename(ova_path), slot.datastore_name, slot.host_name))
+                started = time.time()
+                try:
+                    placed = _PlacedVCenter(vcenter, slot)
+                    the_vm = vsphere_call(virtual_machine.deploy_from_ova,
+                                          vcenter=placed,
+                                          ova=ova,
+                                          network_map=[network_map],
+                                          username=username,
+                                          machine_name=machine_name,
+                                          logger=logger,
+                                          power_on=False,
+                                          idempotent=False)
+                except Exception:
+                    PLACEMENT.release(slot)
+                    raise
+                PLACEMENT.release(slot, seconds=time.time() - started)
+            finally:
+                ova.close()
+
+            vsphere_call(virtual_machine.add_vmdk, the_vm, disk_size=500, idempotent=False) # GB
+            meta_data = {'component' : "DataDomain",
+                         'created' : time.time(),
+                         'version' : image,
+                         'configured' : False,
+                         'generation' : 1,
+                         'placement' : {'datastore': slot.datastore_name, 'host': slot.host_name},
+                         'baseline_snapshot' : snapshot}
+            # The meta data lives in the VM config, so set it before taking the
+            # snapshot, otherwise a reset would revert it away.
+            vsphere_call(virtual_machine.set_meta, the_vm, meta_data)
+            if snapshot:
+                logger.debug('taking baseline snapshot')
+                snap_task = vsphere_call(the_vm.CreateSnapshot_Task,
+                                         name=BASELINE_SNAPSHOT,
+                                         description='State of the Data Domain when it was created',
+                                         memory=False,
+                                         quiesce=False,
+                                         idempotent=False)
+                vsphere_call(consume_task, snap_task)
+            vsphere_call(virtual_machine.power, the_vm, state='on')
+            info = vsphere_call(virtual_machine.get_info, vcenter, the_vm, username, ensure_ip=True)
+            return  {the_vm.name: info}
+        except SoftTimeLimitExceeded:
+            # The task was cancelled. An upload in progress has already had its
+            # lease aborted by the Ova object, which removes the partial VM, but
+            # a lease still being waited on is only known to us.
+            logger.info('Create cancelled')
+            if the_vm is not None:
+                discard_vm(the_vm, logger)
+            elif placed is not None and placed.resource_pool.lease is not None:
+                abort_lease(placed.resource_pool.lease, logger)
+            raise ValueError('Creation of {} was cancelled'.format(machine_name))
+        except (CircuitOpenError,) + TRANSIENT_FAULTS:
+            # vCenter stopped answering part way through; don't leave a half
+            # built VM behind that the user can't see or delete.
+            if the_vm is not None:
+                logger.error('Lost vCenter while creating {}'.format(machine_name))
+                discard_vm(the_vm, logger)
+            raise
+
+
+def preflight(vcenter, username, machine_name, image, network):
+    """Cheap checks that a new DataDomain can be created, done before any
+    expensive I/O. Reads from the OVF descriptor and placement caches, so
+    only the network and name lookups go to vCenter.
+
+    :Returns: Tuple (String path to the OVA, Dictionary OVF descriptor, vim.Network)
+
+    :Raises: ValueError describing the first problem found
+
+    :param vcenter: An established connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param username: The name of the user who wants to create a new DataDomain
+    :type username: String
+
+    :param machine_name: The name of the new instance of DataDomain
+    :type machine_name: String
+
+    :param image: The image/version of DataDomain to create
+    :type image: String
+
+    :param network: The name of the network to connect the new DataDomain instance up to
+    :type network: String
+    """
+    _check_machine_name(machine_name)
+    ova_path = os.path.join(const.VLAB_DATADOMAIN_IMAGES_DIR, convert_name(image))
+    try:
+        descriptor = ovf_cache.get_descriptor(ova_path)
+    except FileNotFoundError:
+        raise ValueError('No such image {}'.format(image))
+    try:
+        the_network = vsphere_call(getattr, vcenter, 'networks')[network]
+    except KeyError:
+        raise ValueError('No such network named {}'.format(network))
+    folder = vsphere_call(vcenter.get_by_name, name=username, vimtype=vim.Folder)
+    for entity in vsphere_call(getattr, folder, 'childEntity'):
+        if entity.name == machine_name:
+            raise ValueError('You already have a machine named {}'.format(machine_name))
+    required = ovf_cache.deployed_size(descriptor)
+    available = vsphere_call(PLACEMENT.max_free, vcenter)
+    if available < required:
+        error = 'Not enough free space for image {}; needs {} GB'.format(image, round(required / 1024**3, 1))
+        raise ValueError(error)
+    return ova_path, descriptor, the_network
+
+
+def _check_machine_name(machine_name):
+    """Names become the VM's hostname, so they must be valid hostnames
+
+    :Raises: ValueError
+
+    :param machine_name: The name of the new virtual machine
+    :type machine_name: String
+    """
+    if not re.match(HOSTNAME_REGEX, machine_name):
+        error = 'Invalid machine name. Names can only contain characters a-z, A-Z, 0-9, periods (".") and dashes ("-"). Supplied: {}'.format(machine_name)
+        raise ValueError(error)
+
+
+def reset_datadomain(username, machine_name, logger):
+    """Revert a DataDomain to the baseline snapshot taken when it was created
+
+    :Returns: Dictionary
+
+    :Raises: ValueError if the VM does not exist, or has no baseline snapshot
+
+    :param username: The user who wants to reset their DataDomain
+    :type username: String
+
+    :param machine_name: The name of the VM to reset
+    :type machine_name: String
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    with _connect() as vcenter:
+        the_vm = _find_datadomain(vcenter, username, machine_name)
+        snapshots = vsphere_call(getattr, the_vm, 'snapshot')
+        baseline = None
+        if snapshots:
+            baseline = _find_snapshot(snapshots.rootSnapshotList, BASELINE_SNAPSHOT)
+        if baseline is None:
+            raise ValueError('{} was not created with a baseline snapshot'.format(machine_name))
+        logger.debug('reverting to baseline snapshot')
+        revert_task = vsphere_call(baseline.RevertToSnapshot_Task, idempotent=False)
+        vsphere_call(consume_task, revert_task)
+        # The snapshot was taken while powered off
+        vsphere_call(virtual_machine.power, the_vm, state='on')
+        info = vsphere_call(virtual_machine.get_info, vcenter, the_vm, username)
+        return {the_vm.name: info}
+
+
+def _find_datadomain(vcenter, username, machine_name):
+    """Look up one of the user's DataDomain VMs by name
+
+    :Returns: vim.VirtualMachine
+
+    :Raises: ValueError if the user has no DataDomain by that name
+
+    :param vcenter: An established connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param username: The user who owns the VM
+    :type username: String
+
+    :param machine_name: The name of the VM
+    :type machine_name: String
+    """
+    folder = vsphere_call(vcenter.get_by_name, name=username, vimtype=vim.Folder)
+    for entity in vsphere_call(getattr, folder, 'childEntity'):
+        if entity.name == machine_name:
+            info = vsphere_call(virtual_machine.get_info, vcenter, entity, username)
+            if info['meta']['component'] == 'DataDomain':
+                return entity
+    raise ValueError('No {} named {} found'.format('datadomain', machine_name))
+
+
+def _find_snapshot(snapshot_tree, name):
+    """Depth first search of a VM's snapshots
+
+    :Returns: vim.vm.Snapshot or None
+
+    :param snapshot_tree: The snapshots to search through
+    :type snapshot_tree: List of vim.vm.SnapshotTree
+
+    :param name: The name of the snapshot to find
+    :type name: String
+    """
+    for node in snapshot_tree:
+        if node.name == name:
+            return node.snapshot
+        found = _find_snapshot(node.childSnapshotList, name)
+        if found is not None:
+            return found
+    return None
+
+
+def discard_vm(the_vm, logger):
+    """Throw away a half built VM. Waits at most ``DISCARD_TIMEOUT`` seconds for
+    it to power off, and does not wait on vCenter to finish destroying it, so
+    the worker is freed up quickly.
+
+    This is cleanup after something already went wrong, often vCenter itself,
+    so it skips the circuit breaker and only logs if vCenter won't cooperate.
+
+    :Returns: None
+
+    :param the_vm: The virtual machine to get rid of
+    :type the_vm: vim.VirtualMachine
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    try:
+        if the_vm.runtime.powerState != 'poweredOff':
+            logger.debug('powering off VM')
+            task = the_vm.PowerOffVM_Task()
+            deadline = time.time() + DISCARD_TIMEOUT
+            while task.info.state in ('queued', 'running'):
+                if time.time() > deadline:
+                    raise RuntimeError('Timed out waiting on VM to power off')
+                time.sleep(1)
+        logger.debug('destroying VM')
+        the_vm.Destroy_Task()
+    except Exception as doh:
+        logger.error('Unable to discard VM {}: {}'.format(the_vm._moId, doh))
+
+
+def abort_lease(lease, logger):
+    """Give up on an OVA deploy lease, which makes vCenter remove the VM it
+    was creating. Like ``discard_vm``, this skips the circuit breaker.
+
+    :Returns: None
+
+    :param lease: The lease obtained to upload an OVA
+    :type lease: vim.HttpNfcLease
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    try:
+        if lease.state in ('initializing', 'ready'):
+            logger.debug('aborting deploy lease')
+            lease.HttpNfcLeaseAbort()
+    except Exception as doh:
+        logger.error('Unable to abort deploy lease {}: {}'.format(lease._moId, doh))
+
+
+class _LeaseRecordingPool(vim.ResourcePool):
+    """A resource pool that keeps the lease from the last OVA import it started.
+    ``virtual_machine.deploy_from_ova`` waits on the lease without handing it
+    back, so this is the only way to abort it if the create is cancelled."""
+    lease = None
+
+    def ImportVApp(self, *args, **kwargs):
+        lease = super().ImportVApp(*args, **kwargs)
+        # pyVmomi makes managed objects read-only; this attribute is ours, not vCenter's
+        object.__setattr__(self, 'lease', lease)
+        return lease
+
+
+class _PlacedVCenter(object):
+    """Makes ``virtual_machine.deploy_from_ova`` deploy to a chosen datastore and
+    host, instead of picking them at random. Everything else is passed through
+    to the real vCenter connection.
+
+    :param vcenter: An established connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param slot: Where to deploy the new VM
+    :type slot: vlab_datadomain_api.lib.worker.placement.Slot
+    """
+    def __init__(self, vcenter, slot):
+        self._vcenter = vcenter
+        datastore = _bind(vcenter, vim.Datastore, slot.datastore_moid)
+        # Whichever datastore name deploy_from_ova picks, it gets the chosen one
+        self.datastores = collections.defaultdict(lambda: datastore)
+        self.host_systems = {slot.host_name: _bind(vcenter, vim.HostSystem, slot.host_moid)}
+        pool = vcenter.resource_pools[const.INF_VCENTER_RESORUCE_POOL]
+        self.resource_pool = _bind(vcenter, _LeaseRecordingPool, pool._moId)
+        self.resource_pools = {const.INF_VCENTER_RESORUCE_POOL: self.resource_pool}
+
+    def __getattr__(self, name):
+        return getattr(self._vcenter, name)
+
+
+def _bind(vcenter, vimtype, moid):
+    """Turn a moId back into a managed object on the given vCenter session.
+    The only place that reaches into the session's stub.
+
+    :Returns: vim.ManagedEntity
+
+    :param vcenter: An established connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vcenter.vCenter
+
+    :param vimtype: The kind of object, i.e. vim.VirtualMachine
+    :type vimtype: pyVmomi.VmomiSupport.LazyType
+
+    :param moid: The managed object id, i.e. "vm-123"
+    :type moid: String
+    """
+    return vimtype(moid, vcenter._conn._stub)
 
 
 def list_images():
@@ -123,6 +653,15 @@ def list_images():
     return images
 
 
+def images_available():
+    """Check that this worker can read the directory of DataDomain OVAs
+
+    :Returns: Boolean
+    """
+    images_dir = const.VLAB_DATADOMAIN_IMAGES_DIR
+    return os.path.isdir(images_dir) and os.access(images_dir, os.R_OK)
+
+
 def convert_name(name, to_version=False):
     """This function centralizes converting between the name of the OVA, and the
     version of software it contains.
@@ -0,0 +1,44 @@
+# -*- coding: UTF-8 -*-
+"""
+Production entry point for the datadomain API.
+
+Runs ``app.py`` under uWSGI, sizing the pool of processes and threads from the
+environment. Use ``python3 app.py`` for local development instead.
+
+.. note::
+    Both default to 1. Celery's ``rpc://`` result backend only delivers a
+    task's result to the thread that sent the task, so with more than one
+    process or thread a poll of ``/task/<id>`` can land elsewhere and report
+    PENDING forever. Only raise them once the API uses a shared result backend.
+"""
+import os
+
+from vlab_datadomain_api.lib import const
+
+APP_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.ini')
+
+
+def uwsgi_args(ini=APP_INI):
+    """Build the command line for running the API under uWSGI
+
+    :Returns: List
+
+    :param ini: The path to the uWSGI config file
+    :type ini: String
+    """
+    return ['uwsgi', '--need-app', '--ini', ini,
+            '--processes', str(const.VLAB_DATADOMAIN_API_PROCESSES),
+            '--threads', str(const.VLAB_DATADOMAIN_API_THREADS),
+            '--listen', str(const.VLAB_DATADOMAIN_API_LISTEN)]
+
+
+def main():
+    """Replace the current process with uWSGI serving the API"""
+    # app.ini refers to app.py by a relative path
+    os.chdir(os.path.dirname(APP_INI))
+    args = uwsgi_args()
+    os.execvp(args[0], args)
+
+
+if __name__ == '__main__':
+    main()